@@ -504,10 +504,11 @@ class Compiler(compiler.Compiler):
         self.instr_to_lafter = {}
 
         analyze_dataflow(
-            transpose(cfg),
+            cfg,
             lambda label, l_after: self.transfer(basic_blocks, label, l_after),
             set(),
             lambda a, b: a.union(b),
+            direction='backward',
         )
 
         return self.instr_to_lafter
@@ -1,8 +1,7 @@
 import compiler
-from graph import UndirectedAdjList
+from graph import UndirectedAdjList, saturation_coloring
 from ast import *
 from x86_ast import *
-import copy
 
 label = lambda v: v.id if isinstance(v, Reg) else str(v)
 
@@ -102,6 +101,19 @@ class Compiler(compiler.Compiler):
     # Build Interference
     ############################################################################
 
+    # Connects the locations moved between by movq, for move-biased
+    # coloring. Locations that interfere cannot share a home and are left
+    # out.
+    def build_move_graph(self, p: X86Program, rig: UndirectedAdjList) -> UndirectedAdjList:
+        graph = UndirectedAdjList(vertex_label=label)
+        for instr in p.body:
+            match instr:
+                case Instr('movq', [Variable(_) | Reg(_) as s, Variable(_) | Reg(_) as d]) \
+                     if s != d and (isinstance(s, Variable) or isinstance(d, Variable)) \
+                     and not rig.has_edge(s, d):
+                    graph.add_edge(s, d)
+        return graph
+
     def build_interference(
         self, p: X86Program, live_after: dict[instr, set[location]]
     ) -> UndirectedAdjList:
@@ -131,65 +143,28 @@ class Compiler(compiler.Compiler):
     # Allocate Registers
     ############################################################################
 
-    # select spill candidate by most neighbors
-    def find_spill(self, graph: UndirectedAdjList) -> location:
-        most_neighbors = list(graph.vertices())[0]
-        for v in graph.vertices():
-            if len(graph.adjacent(v)) > len(graph.adjacent(most_neighbors)):
-                most_neighbors = v
-
-        return v
-
+    # Registers in the graph are not colored, but those among the colors
+    # keep their neighbors from using them.
+    # With spill costs given, a variable left without a color may take
+    # the color of a cheaper neighbor, which is spilled instead. With a
+    # move graph, variables prefer the colors of their move partners.
     def color_graph(
-        self, graph: UndirectedAdjList, colors: set[location]
+        self, graph: UndirectedAdjList, colors: list[location],
+        spill_cost: dict[location, float] = None,
+        moves: UndirectedAdjList = None
     ) -> dict[Variable, arg]:
-        coloring = {}
-
-        orig_graph = copy.deepcopy(graph)
-
-        k = len(colors)
-        stack = []
-
-        # for all vertices in the graph, select a vertex and remove it and put it on stack
-        while len(graph.vertices()) > 0:
-            # get vertex v with neighbors(v) < k
-            v = next(
-                filter(lambda v: len(graph.adjacent(v)) < k, graph.vertices()), None
-            )
-
-            # could not find vertex with neighbors(v) < k
-            if v is None:
-                potential_spill = self.find_spill(graph)
-                graph.remove_vertex(potential_spill)
-                stack.append(potential_spill)
-            # found vertex
-            else:
-                graph.remove_vertex(v)
-                stack.append(v)
-
-        # for all vertices on stack, assign a color to them if possible
-        while len(stack) > 0:
-            d = stack.pop()
-
-            if isinstance(d, Reg):
-                continue
-
-            neighbors = orig_graph.adjacent(d)
-
-            # find available color not assigned to neighbors(d)
-            color = next(
-                filter(
-                    lambda c: not c in [coloring.get(u, None) for u in neighbors],
-                    colors,
-                ),
-                None,
-            )
-
-            # if colorable, assign the color
-            if color != None:
-                coloring[d] = color
-
-        return coloring
+        return saturation_coloring(graph, colors, lambda v: isinstance(v, Reg),
+                                   spill_cost, moves)
+
+    # The cost of spilling each variable: its uses and defs divided by its
+    # degree in the interference graph. Programs here have no loops.
+    def spill_costs(self, p: X86Program, graph: UndirectedAdjList) -> dict[location, float]:
+        costs = {}
+        for i in p.body:
+            for v in self.read_vars(i) | self.write_vars(i):
+                if isinstance(v, Variable):
+                    costs[v] = costs.get(v, 0) + 1
+        return {v: c / max(1, graph.degree(v)) for (v, c) in costs.items()}
 
     ############################################################################
     # Assign Homes
@@ -198,7 +173,9 @@ class Compiler(compiler.Compiler):
     def assign_homes(self, p: X86Program) -> X86Program:
         live_after = self.uncover_live(p)
         rig = self.build_interference(p, live_after)
-        home = self.color_graph(rig, registers_for_coloring)
+        home = self.color_graph(rig, registers_for_coloring,
+                                self.spill_costs(p, rig),
+                                self.build_move_graph(p, rig))
 
         return X86Program(super().assign_homes_instrs(p.body, home))
 
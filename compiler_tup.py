@@ -3,8 +3,11 @@ from x86_ast import *
 import x86_ast
 from graph import *
 from utils import *
-from dataflow_analysis import analyze_dataflow
-import copy
+from dataflow_analysis import analyze_dataflow, postorder
+from bisect import bisect_left, bisect_right
+from heapq import heapify, heappush, heappop
+from math import inf
+from itertools import count
 from type_check_Ltup import TypeCheckLtup
 from type_check_Ctup import TypeCheckCtup
 
@@ -12,13 +15,20 @@ Binding = tuple[Name, expr]
 Temporaries = list[Binding]
 get_fresh_tmp = lambda: generate_name('tmp')
 
+# The caller-saved registers come first, so that the callee-saved ones
+# are only used for variables that are live across calls, or when the
+# others run out.
 registers_for_coloring = [
     Reg('rcx'),
     Reg('rdx'),
     Reg('rsi'),
     Reg('r8'),
     Reg('r9'),
-    Reg('r10')
+    Reg('r10'),
+    Reg('rbx'),
+    Reg('r12'),
+    Reg('r13'),
+    Reg('r14'),
 ]
 
 
@@ -49,6 +59,21 @@ def cc(op):
         case Is():
             return 'e'
 
+def negate_cc(c):
+    match c:
+        case 'e':
+            return 'ne'
+        case 'ne':
+            return 'e'
+        case 'l':
+            return 'ge'
+        case 'le':
+            return 'g'
+        case 'g':
+            return 'le'
+        case 'ge':
+            return 'l'
+
 label = lambda v: v.id if isinstance(v, Reg) else str(v)
 
 caller_saved_registers: set[location] = set(
@@ -80,12 +105,135 @@ def get_loc_from_arg(a: arg) -> set[location]:
         case _:
             return set([])
 
+
+# Numbers the locations of one function so that sets of locations can be
+# represented as int bitsets, bit i standing for locations[i].
+class Locations:
+    def __init__(self):
+        self.index: dict[location, int] = {}
+        self.locations: list[location] = []
+
+    def bit(self, loc: location) -> int:
+        i = self.index.get(loc)
+        if i is None:
+            i = self.index[loc] = len(self.locations)
+            self.locations.append(loc)
+        return 1 << i
+
+    def mask(self, locs) -> int:
+        bits = 0
+        for loc in locs:
+            bits |= self.bit(loc)
+        return bits
+
+    def members(self, bits: int) -> list[location]:
+        result = []
+        while bits:
+            low = bits & -bits
+            result.append(self.locations[low.bit_length() - 1])
+            bits ^= low
+        return result
+
+# The live interval of one location over the points of the linearized
+# program: instruction i reads its operands at point 2i and writes its
+# results at point 2i + 1. Ranges are half-open [start, end) pairs in
+# increasing order, with holes where the location is dead; uses are the
+# points at which it is read or written. home is the register or stack
+# slot the interval was given, or None until it is allocated.
+class LiveInterval:
+    def __init__(self, loc: location):
+        self.loc = loc
+        self.ranges: list[list[int]] = []
+        self.uses: list[int] = []
+        self.home = None
+
+    @property
+    def start(self) -> int:
+        return self.ranges[0][0]
+
+    @property
+    def end(self) -> int:
+        return self.ranges[-1][1]
+
+    def add_range(self, start: int, end: int):
+        if self.ranges and self.ranges[-1][1] == start:
+            self.ranges[-1][1] = end
+        else:
+            self.ranges.append([start, end])
+
+    def covers(self, point: int) -> bool:
+        k = bisect_right(self.ranges, point, key=lambda r: r[0]) - 1
+        return k >= 0 and point < self.ranges[k][1]
+
+    # The first point covered by both intervals, or None.
+    def next_intersection(self, other: 'LiveInterval'):
+        (i, j) = (0, 0)
+        while i < len(self.ranges) and j < len(other.ranges):
+            (s1, e1) = self.ranges[i]
+            (s2, e2) = other.ranges[j]
+            if s1 < e2 and s2 < e1:
+                return max(s1, s2)
+            if e1 <= e2:
+                i += 1
+            else:
+                j += 1
+        return None
+
+    # Whether the interval covers any of the given sorted points.
+    def crosses(self, points: list[int]) -> bool:
+        for (start, end) in self.ranges:
+            k = bisect_left(points, start)
+            if k < len(points) and points[k] < end:
+                return True
+        return False
+
+    def next_use(self, point: int):
+        k = bisect_left(self.uses, point)
+        return self.uses[k] if k < len(self.uses) else inf
+
+    # Cuts the interval at point, which must lie after its start, and
+    # returns the part from point on as a new interval.
+    def split(self, point: int) -> 'LiveInterval':
+        rest = LiveInterval(self.loc)
+        k = bisect_right(self.ranges, point, key=lambda r: r[0]) - 1
+        if self.ranges[k][0] == point:
+            rest.ranges = self.ranges[k:]
+            self.ranges = self.ranges[:k]
+        elif point < self.ranges[k][1]:
+            rest.ranges = [[point, self.ranges[k][1]]] + self.ranges[k + 1:]
+            self.ranges = self.ranges[:k] + [[self.ranges[k][0], point]]
+        else:
+            rest.ranges = self.ranges[k + 1:]
+            self.ranges = self.ranges[:k + 1]
+        u = bisect_left(self.uses, point)
+        (self.uses, rest.uses) = (self.uses[:u], self.uses[u:])
+        return rest
+
+
 class Compiler:
     
     env = {}
     stack_size = 0
     root_stack_size = 0
 
+    # allocator selects the assign_homes strategy: 'coloring' colors the
+    # interference graph, 'linear_scan' allocates live intervals in one
+    # pass, trading some code quality for speed on very large programs.
+    #
+    # peephole names the peephole rules to run, by default all of them.
+    def __init__(self, allocator='coloring', peephole=None):
+        if allocator not in ('coloring', 'linear_scan'):
+            raise Exception('unknown register allocator ' + repr(allocator))
+        self.allocator = allocator
+        names = [name for (name, _) in self.peephole_rules]
+        if peephole is None:
+            peephole = names
+        for name in peephole:
+            if name not in names:
+                raise Exception('unknown peephole rule ' + repr(name))
+        self.peephole_enabled = set(peephole)
+        self.peephole_stats = {name: {'applied': 0, 'removed': 0} for name in names}
+
     def tmps_to_stmts(self, tmps: Temporaries) -> list[stmt]:
         result = []
         for tmp in tmps:
@@ -163,6 +311,183 @@ class Compiler:
             new_body.append(self.shrink_stmt(stm))
         return Module(new_body)
 
+    ###########################################################################
+    # Fold Constants
+    ###########################################################################
+
+    # Whether evaluating e has no effect besides computing its value.
+    def is_pure(self, e: expr) -> bool:
+        match e:
+            case Call(Name('input_int'), []):
+                return False
+            case _:
+                return all(self.is_pure(c) for c in iter_child_nodes(e)
+                           if isinstance(c, expr))
+
+    def fold_exp(self, e: expr, consts: dict[str, Constant]) -> expr:
+        match e:
+            case Constant(_) | GlobalValue(_):
+                return e
+            case Name(x):
+                return consts.get(x, e)
+            case BinOp(e1, op, e2):
+                e1 = self.fold_exp(e1, consts)
+                e2 = self.fold_exp(e2, consts)
+                match (e1, op, e2):
+                    case (Constant(n), Add(), Constant(m)):
+                        return Constant(add64(n, m))
+                    case (Constant(n), Sub(), Constant(m)):
+                        return Constant(sub64(n, m))
+                    case (Constant(0), Add(), _):
+                        return e2
+                    case (_, Add() | Sub(), Constant(0)):
+                        return e1
+                    case _:
+                        return BinOp(e1, op, e2)
+            case UnaryOp(op, e1):
+                e1 = self.fold_exp(e1, consts)
+                match (op, e1):
+                    case (USub(), Constant(n)):
+                        return Constant(neg64(n))
+                    case (Not(), Constant(b)):
+                        return Constant(not b)
+                    case _:
+                        return UnaryOp(op, e1)
+            case Compare(left, [op], [right]):
+                left = self.fold_exp(left, consts)
+                right = self.fold_exp(right, consts)
+                match (left, op, right):
+                    case (Constant(n), Eq(), Constant(m)):
+                        return Constant(n == m)
+                    case (Constant(n), NotEq(), Constant(m)):
+                        return Constant(n != m)
+                    case (Constant(n), Lt(), Constant(m)):
+                        return Constant(n < m)
+                    case (Constant(n), LtE(), Constant(m)):
+                        return Constant(n <= m)
+                    case (Constant(n), Gt(), Constant(m)):
+                        return Constant(n > m)
+                    case (Constant(n), GtE(), Constant(m)):
+                        return Constant(n >= m)
+                    case _:
+                        return Compare(left, [op], [right])
+            case IfExp(test, body, orelse):
+                test = self.fold_exp(test, consts)
+                match test:
+                    case Constant(True):
+                        return self.fold_exp(body, consts)
+                    case Constant(False):
+                        return self.fold_exp(orelse, consts)
+                    case _:
+                        return IfExp(test, self.fold_exp(body, consts),
+                                     self.fold_exp(orelse, consts))
+            case Call(Name('input_int'), []):
+                return e
+            case Call(Name('len'), [tup]):
+                tup = self.fold_exp(tup, consts)
+                # tuple types fix the length
+                if self.is_pure(tup):
+                    match TypeCheckLtup().type_check_exp(tup, self.fold_types):
+                        case TupleType(ts):
+                            return Constant(len(ts))
+                return Call(Name('len'), [tup])
+            case Subscript(tup, index, ctx):
+                return Subscript(self.fold_exp(tup, consts), index, ctx)
+            case Tuple(exprs, ctx):
+                return Tuple([self.fold_exp(e1, consts) for e1 in exprs], ctx)
+            case _:
+                raise Exception('unhandled case in fold_exp: ' + repr(e))
+
+    # The variables assigned anywhere in ss.
+    def assigned_vars(self, ss: list[stmt]) -> set[str]:
+        result = set()
+        for s in ss:
+            for node in walk(s):
+                match node:
+                    case Assign([Name(x)], _):
+                        result.add(x)
+        return result
+
+    # Folds the statements, propagating the constants assigned to
+    # variables through straight-line code. consts maps the variables
+    # known to hold a constant on entry, and is updated to those on exit.
+    def fold_stmts(self, ss: list[stmt], consts: dict[str, Constant]) -> list[stmt]:
+        result = []
+        for s in ss:
+            match s:
+                case Assign([Name(x)] as lhs, rhs):
+                    rhs = self.fold_exp(rhs, consts)
+                    if isinstance(rhs, Constant):
+                        consts[x] = rhs
+                    else:
+                        consts.pop(x, None)
+                    result.append(Assign(lhs, rhs))
+                case Expr(Call(Name('print'), [arg])):
+                    result.append(Expr(Call(Name('print'), [self.fold_exp(arg, consts)])))
+                case Expr(e):
+                    e = self.fold_exp(e, consts)
+                    if not self.is_pure(e):
+                        result.append(Expr(e))
+                case If(test, thn, els):
+                    test = self.fold_exp(test, consts)
+                    match test:
+                        case Constant(True):
+                            result += self.fold_stmts(thn, consts)
+                        case Constant(False):
+                            result += self.fold_stmts(els, consts)
+                        case _:
+                            thn_consts = dict(consts)
+                            els_consts = dict(consts)
+                            thn = self.fold_stmts(thn, thn_consts)
+                            els = self.fold_stmts(els, els_consts)
+                            consts.clear()
+                            consts.update((x, c) for (x, c) in thn_consts.items()
+                                          if x in els_consts
+                                          and els_consts[x].value == c.value)
+                            result.append(If(test, thn, els))
+                case While(test, body, []):
+                    # nothing assigned in the loop is known at its head
+                    for x in self.assigned_vars(body):
+                        consts.pop(x, None)
+                    test = self.fold_exp(test, consts)
+                    match test:
+                        case Constant(False):
+                            pass
+                        case _:
+                            body = self.fold_stmts(body, dict(consts))
+                            result.append(While(test, body, []))
+                case _:
+                    raise Exception('unhandled case in fold_stmts: ' + repr(s))
+        return result
+
+    # Drops the assignments of constants to variables that are no longer
+    # read anywhere once their uses have been replaced.
+    def drop_constant_assigns(self, ss: list[stmt], read: set[str]) -> list[stmt]:
+        result = []
+        for s in ss:
+            match s:
+                case Assign([Name(x)], Constant(_)) if x not in read:
+                    pass
+                case If(test, thn, els):
+                    result.append(If(test, self.drop_constant_assigns(thn, read),
+                                     self.drop_constant_assigns(els, read)))
+                case While(test, body, []):
+                    result.append(While(test, self.drop_constant_assigns(body, read), []))
+                case _:
+                    result.append(s)
+        return result
+
+    def fold_constants(self, p: Module) -> Module:
+        # the types of the variables, for the length of tuples
+        self.fold_types = {}
+        TypeCheckLtup().type_check_stmts(p.body, self.fold_types)
+
+        body = self.fold_stmts(p.body, {})
+        read = set(node.id for node in walk(Module(body))
+                   if isinstance(node, Name)
+                   and not isinstance(getattr(node, 'ctx', None), Store))
+        return Module(self.drop_constant_assigns(body, read))
+
     ###########################################################################
     # Expose Allocation
     ###########################################################################
@@ -561,6 +886,212 @@ class Compiler:
                 basic_blocks[label_name('start')] = new_body
                 return CProgram(basic_blocks)
 
+    ############################################################################
+    # Number Values
+    ############################################################################
+
+    # The key under which a pure expression is numbered, from the value
+    # numbers of its operands, or None when the expression has an effect
+    # or reads a global.
+    def value_key(self, e: expr, operand) -> tuple | None:
+        match e:
+            case BinOp(a, Add(), b):
+                (na, nb) = (operand(a), operand(b))
+                return None if na is None or nb is None else ('add', min(na, nb), max(na, nb))
+            case BinOp(a, Sub(), b):
+                (na, nb) = (operand(a), operand(b))
+                return None if na is None or nb is None else ('sub', na, nb)
+            case Compare(a, [op], [b]):
+                (na, nb) = (operand(a), operand(b))
+                return None if na is None or nb is None else ('cmp', type(op).__name__, na, nb)
+            case UnaryOp(USub(), a):
+                na = operand(a)
+                return None if na is None else ('neg', na)
+            case UnaryOp(Not(), a):
+                na = operand(a)
+                return None if na is None else ('not', na)
+            case Call(Name('len'), [a]):
+                na = operand(a)
+                return None if na is None else ('len', na)
+            case Subscript(a, Constant(i), Load()):
+                na = operand(a)
+                return None if na is None else ('load', na, i)
+            case _:
+                return None
+
+    # Local value numbering. Within a block, an assignment of a pure
+    # expression that was already computed becomes a copy of a variable
+    # (or constant) that still holds the value. A store into a tuple
+    # forgets the loads of the same element of every tuple, a collection
+    # forgets all loads, and a store of an atom is remembered as a load
+    # of that element.
+    def number_block(self, ss: list[stmt]) -> list[stmt]:
+        fresh = count()
+        numbers = {}      # expression key -> value number
+        var_numbers = {}  # variable -> number of the value it holds
+        holders = {}      # value number -> variables and constants
+        loads = set()
+
+        def new_number(*hs):
+            n = next(fresh)
+            holders[n] = list(hs)
+            return n
+
+        def operand(a):
+            match a:
+                case Constant(v):
+                    key = ('const', type(v), v)
+                    if key not in numbers:
+                        numbers[key] = new_number(a)
+                    return numbers[key]
+                case Name(x):
+                    if x not in var_numbers:
+                        var_numbers[x] = new_number(x)
+                    return var_numbers[x]
+                case _:
+                    return None
+
+        def holder(n):
+            for h in holders[n]:
+                match h:
+                    case Constant(_):
+                        return h
+                    case str(x) if var_numbers[x] == n:
+                        return Name(x)
+            return None
+
+        def forget_loads(i=None):
+            for key in list(loads):
+                if i is None or key[2] == i:
+                    numbers.pop(key)
+                    loads.remove(key)
+
+        result = []
+        for s in ss:
+            match s:
+                case Assign([Name(x)] as lhs, rhs):
+                    match rhs:
+                        case Constant(_) | Name(_):
+                            n = operand(rhs)
+                        case _:
+                            key = self.value_key(rhs, operand)
+                            if key is None:
+                                n = new_number()
+                            elif key in numbers and holder(numbers[key]) is not None:
+                                n = numbers[key]
+                                s = Assign(lhs, holder(n))
+                            else:
+                                n = numbers[key] = new_number()
+                                if key[0] == 'load':
+                                    loads.add(key)
+                    var_numbers[x] = n
+                    holders[n].append(x)
+                case Assign([Subscript(tup, Constant(i), Store())], rhs):
+                    forget_loads(i)
+                    if isinstance(rhs, (Constant, Name)):
+                        key = ('load', operand(tup), i)
+                        numbers[key] = operand(rhs)
+                        loads.add(key)
+                case Collect(_):
+                    forget_loads()
+            result.append(s)
+        return result
+
+    def number_values(self, p: CProgram) -> CProgram:
+        return CProgram({label: self.number_block(ss)
+                         for (label, ss) in p.body.items()})
+
+    ############################################################################
+    # Remove Dead Code
+    ############################################################################
+
+    # The labels a C block can jump to.
+    def c_successors(self, ss: list[stmt]) -> list[str]:
+        result = []
+        for s in ss:
+            match s:
+                case Goto(label):
+                    result.append(label)
+                case If(_, [Goto(thn)], [Goto(els)]):
+                    result += [thn, els]
+        return result
+
+    # The variables a C statement reads and writes.
+    def c_reads(self, s: stmt) -> set[str]:
+        match s:
+            case Assign([Name(_)], rhs):
+                exprs = [rhs]
+            case Assign([Subscript(tup, _, _)], rhs):
+                exprs = [tup, rhs]
+            case Expr(e) | Return(e):
+                exprs = [e]
+            case If(test, _, _):
+                exprs = [test]
+            case _:
+                exprs = []
+        return set(node.id for e in exprs for node in walk(e)
+                   if isinstance(node, Name))
+
+    def c_writes(self, s: stmt) -> set[str]:
+        match s:
+            case Assign([Name(x)], _):
+                return set([x])
+            case _:
+                return set()
+
+    def c_transfer(self, ss: list[stmt], live_after: set[str]) -> set[str]:
+        live = set(live_after)
+        for s in reversed(ss):
+            live = (live - self.c_writes(s)) | self.c_reads(s)
+        return live
+
+    # Removes the blocks unreachable from start, then the assignments to
+    # variables that are dead afterwards and whose right-hand side has no
+    # effect, until none are left.
+    def remove_dead_code(self, p: CProgram) -> CProgram:
+        start = label_name('start')
+        reachable = set([start])
+        todo = [start]
+        while todo:
+            for label in self.c_successors(p.body[todo.pop()]):
+                if label not in reachable:
+                    reachable.add(label)
+                    todo.append(label)
+        blocks = {label: ss for (label, ss) in p.body.items() if label in reachable}
+
+        cfg = DirectedAdjList()
+        for (label, ss) in blocks.items():
+            cfg.add_vertex(label)
+            for target in self.c_successors(ss):
+                cfg.add_edge(label, target)
+
+        changed = True
+        while changed:
+            changed = False
+            live_in = analyze_dataflow(
+                cfg,
+                lambda label, live_after: self.c_transfer(blocks[label], live_after),
+                set(),
+                lambda a, b: a | b,
+                direction='backward',
+            )
+            for (label, ss) in blocks.items():
+                live = set()
+                for target in self.c_successors(ss):
+                    live |= live_in[target]
+                kept = []
+                for s in reversed(ss):
+                    match s:
+                        case Assign([Name(x)], rhs) if x not in live and self.is_pure(rhs):
+                            changed = True
+                            continue
+                    live = (live - self.c_writes(s)) | self.c_reads(s)
+                    kept.append(s)
+                kept.reverse()
+                blocks[label] = kept
+
+        return CProgram(blocks)
+
     ############################################################################
     # Select Instructions
     ############################################################################
@@ -644,7 +1175,7 @@ class Compiler:
                 unused = 0b000000   #  6 bits unused
                 mask   = 0          # 51 bits for mask (1 ptr, 0 data)
                 length = n          #  6 bits for length
-                fwd    = 0b0        #  1 bit for forwarding (GC)
+                fwd    = 0b1        #  1 bit, set while not forwarded (GC)
                 
                 index = 0
                 for type in t.types:
@@ -753,6 +1284,161 @@ class Compiler:
 
         return X86Program(new_body)
 
+    ###########################################################################
+    # Layout Blocks
+    ###########################################################################
+
+    # The labels a block ends by jumping to, the conditional target first.
+    def block_targets(self, instrs: list[instr]) -> list[str]:
+        match instrs[-2:]:
+            case [JumpIf(_, thn), Jump(els)]:
+                return [thn, els]
+        match instrs[-1:]:
+            case [Jump(label)]:
+                return [label]
+        return []
+
+    # The body of every loop by its header, from the back edges of a
+    # depth-first search.
+    def find_loops(self, blocks: dict[str, list[instr]], start: str) -> dict[str, set[str]]:
+        succs = {label: [t for t in self.block_targets(instrs) if t in blocks]
+                 for (label, instrs) in blocks.items()}
+        preds = {label: [] for label in blocks}
+        for (label, targets) in succs.items():
+            for t in targets:
+                preds[t].append(label)
+
+        back_edges = []
+        visited = set([start])
+        on_stack = set([start])
+        stack = [(start, iter(succs[start]))]
+        while stack:
+            (label, children) = stack[-1]
+            for child in children:
+                if child in on_stack:
+                    back_edges.append((label, child))
+                elif child not in visited:
+                    visited.add(child)
+                    on_stack.add(child)
+                    stack.append((child, iter(succs[child])))
+                    break
+            else:
+                stack.pop()
+                on_stack.remove(label)
+
+        loops = {}
+        for (tail, header) in back_edges:
+            body = loops.setdefault(header, set([header]))
+            todo = [tail] if tail not in body else []
+            body.add(tail)
+            while todo:
+                for p in preds[todo.pop()]:
+                    if p not in body:
+                        body.add(p)
+                        todo.append(p)
+        return loops
+
+    # Threads jumps through blocks that only jump elsewhere, drops the
+    # blocks that are no longer reachable, and merges each block into its
+    # only predecessor when that predecessor jumps to it unconditionally.
+    # The remaining blocks are laid out in chains that continue with the
+    # most deeply nested successor, and each loop is rotated so that its
+    # header comes after the body and tests at the bottom. Conditional
+    # jumps are inverted where that makes the unconditional jump at the
+    # end of a block go to the next block, which is then left out of the
+    # assembly.
+    def layout_blocks(self, p: X86Program) -> X86Program:
+        start = label_name('start')
+        blocks = dict(p.body)
+
+        def final(label):
+            seen = set()
+            while label in blocks and label not in seen:
+                seen.add(label)
+                match blocks[label]:
+                    case [Jump(target)]:
+                        label = target
+                    case _:
+                        break
+            return label
+
+        for (label, instrs) in blocks.items():
+            match instrs[-3:]:
+                case [Instr('cmpq', _), JumpIf(c, thn), Jump(els)]:
+                    (thn, els) = (final(thn), final(els))
+                    if thn == els:
+                        blocks[label] = instrs[:-3] + [Jump(els)]
+                    else:
+                        blocks[label] = instrs[:-2] + [JumpIf(c, thn), Jump(els)]
+                case [*_, Jump(target)]:
+                    blocks[label] = instrs[:-1] + [Jump(final(target))]
+
+        reachable = set([start])
+        todo = [start]
+        while todo:
+            for t in self.block_targets(blocks[todo.pop()]):
+                if t in blocks and t not in reachable:
+                    reachable.add(t)
+                    todo.append(t)
+        blocks = {label: instrs for (label, instrs) in blocks.items()
+                  if label in reachable}
+
+        num_preds = {label: 0 for label in blocks}
+        for instrs in blocks.values():
+            for t in self.block_targets(instrs):
+                if t in blocks:
+                    num_preds[t] += 1
+        for label in list(blocks):
+            if label not in blocks:
+                continue
+            while True:
+                match blocks[label][-2:]:
+                    case [JumpIf(_, _), Jump(_)]:
+                        break
+                    case [*_, Jump(target)] if target in blocks and target != start \
+                            and target != label and num_preds[target] == 1:
+                        blocks[label] = blocks[label][:-1] + blocks.pop(target)
+                    case _:
+                        break
+
+        loops = self.find_loops(blocks, start)
+        depth = {label: 0 for label in blocks}
+        for body in loops.values():
+            for label in body:
+                depth[label] += 1
+
+        order = []
+        todo = [start]
+        while todo:
+            label = todo.pop()
+            while label is not None and label not in order:
+                order.append(label)
+                targets = [t for t in self.block_targets(blocks[label])
+                           if t in blocks and t not in order]
+                # prefer the unconditional target when the depths are equal
+                following = max(reversed(targets), key=lambda t: depth[t],
+                                default=None)
+                todo += [t for t in targets if t != following]
+                label = following
+
+        # move each loop header after the run of its body that follows it
+        for (header, body) in loops.items():
+            i = order.index(header)
+            j = i
+            while j + 1 < len(order) and order[j + 1] in body:
+                j += 1
+            match blocks[order[j]][-1:]:
+                case [Jump(target)] if j > i and target == header:
+                    order = order[:i] + order[i + 1:j + 1] + [header] + order[j + 1:]
+
+        for (k, label) in enumerate(order):
+            match blocks[label][-2:]:
+                case [JumpIf(c, thn), Jump(els)] if order[k + 1:k + 2] == [thn]:
+                    blocks[label] = blocks[label][:-2] + \
+                        [JumpIf(negate_cc(c), els), Jump(thn)]
+
+        return X86Program({label: blocks[label] for label in order})
+
     ###########################################################################
     # Uncover Live
     ###########################################################################
@@ -804,58 +1490,115 @@ class Compiler:
 
         return cfg
 
-    def transfer(self, basic_blocks, block_id, l_after: set[location]):
-        if block_id == 'conclusion':
-            l_before = set([Reg('rax'), Reg('rsp')])
-        else:
-            l_before = set()
+    # The read and write sets of every instruction as bitsets over
+    # self.locations, computed once before the dataflow analysis.
+    def instr_masks(self, basic_blocks) -> dict[str, list[tuple[int, int]]]:
+        self.locations = Locations()
+        return {
+            block_id: [
+                (self.locations.mask(self.read_vars(i)),
+                 self.locations.mask(self.write_vars(i)))
+                for i in instrs
+            ]
+            for block_id, instrs in basic_blocks.items()
+        }
 
-        for instr in reversed(basic_blocks[block_id]):
-            self.instr_to_lafter[instr] = l_after
-            l_before = (l_after - self.write_vars(instr)) | self.read_vars(instr)
-            l_after = l_before
+    def transfer(self, block_id, l_after: int) -> int:
+        masks = self.block_masks[block_id]
+        lafters = [0] * len(masks)
+        for k in range(len(masks) - 1, -1, -1):
+            lafters[k] = l_after
+            (reads, writes) = masks[k]
+            l_after = (l_after & ~writes) | reads
+        if block_id == 'conclusion':
+            l_after |= self.conclusion_live
 
-        self.block_to_lafter[block_id] = l_after
-        return l_before
+        self.live_after[block_id] = lafters
+        return l_after
 
-    def uncover_live_blocks(self, basic_blocks) -> dict[instr, set[location]]:
+    # Returns the live-after bitset of each instruction, by block and
+    # position in the block.
+    def uncover_live_blocks(self, basic_blocks) -> dict[str, list[int]]:
         cfg = self.control_flow_graph(basic_blocks)
+        self.cfg = cfg
 
-        self.block_to_lafter = {}
-        self.instr_to_lafter = {}
+        self.block_masks = self.instr_masks(basic_blocks)
+        self.conclusion_live = self.locations.mask([Reg('rax'), Reg('rsp')])
+        self.live_after = {block_id: [0] * len(instrs)
+                           for block_id, instrs in basic_blocks.items()}
 
         analyze_dataflow(
-            transpose(cfg),
-            lambda label, l_after: self.transfer(basic_blocks, label, l_after),
-            set(),
-            lambda a, b: a.union(b),
+            cfg,
+            self.transfer,
+            0,
+            lambda a, b: a | b,
+            direction='backward',
         )
 
-        return self.instr_to_lafter
+        return self.live_after
+
+    # The locations live across each call.
+    def live_across_calls(self, p: X86Program, live_blocks) -> dict[Callq, list[location]]:
+        return {
+            i: self.locations.members(live_blocks[block_id][k])
+            for block_id, instrs in p.body.items()
+            for (k, i) in enumerate(instrs)
+            if isinstance(i, Callq)
+        }
+
+    # The caller-saved registers among the homes of the locations live
+    # across a call, which patch_instr saves around it.
+    def call_saves(self, homes) -> list[Reg]:
+        homes = set(homes)
+        return [r for r in registers_for_coloring
+                if r in caller_saved_registers and r in homes]
 
     ############################################################################
     # Build Interference
     ############################################################################
 
+    # Connects the locations moved between by movq, for move-biased
+    # coloring. Locations that interfere cannot share a home and are left
+    # out.
+    def build_move_graph(self, p: X86Program, rig: UndirectedAdjList) -> UndirectedAdjList:
+        graph = UndirectedAdjList(vertex_label=label)
+        for instrs in p.body.values():
+            for instr in instrs:
+                match instr:
+                    case Instr('movq', [Variable(_) | Reg(_) as s, Variable(_) | Reg(_) as d]) \
+                         if s != d and (isinstance(s, Variable) or isinstance(d, Variable)) \
+                         and not rig.has_edge(s, d):
+                        graph.add_edge(s, d)
+        return graph
+
     def build_interference(self, p: X86Program, live_blocks) -> UndirectedAdjList:
         graph = UndirectedAdjList(vertex_label=label)
+        locations = self.locations
 
-        for (_, vs) in live_blocks.items():
-            for v in vs:
-                graph.add_vertex(v)
+        ever_live = 0
+        for lafters in live_blocks.values():
+            for l_after in lafters:
+                ever_live |= l_after
+        for v in locations.members(ever_live):
+            graph.add_vertex(v)
 
         for block_id, instrs in p.body.items():
-            for instr in instrs:
-                l_after = live_blocks[instr]
+            masks = self.block_masks[block_id]
+            for (k, instr) in enumerate(instrs):
+                l_after = live_blocks[block_id][k]
+                writes = masks[k][1]
                 match instr:
                     case Instr('movq', [s, d]) | Instr('movzbq', [s, d]):
-                        for v in l_after:
-                            if v != s and v != d and not graph.has_edge(v, d):
-                                graph.add_edge(v, d)
+                        # the source of a move may share the destination's home
+                        sources = locations.mask(get_loc_from_arg(s))
+                        for d in locations.members(writes):
+                            for v in locations.members(l_after & ~sources & ~writes):
+                                if not graph.has_edge(v, d):
+                                    graph.add_edge(v, d)
                     case _:
-                        for v in l_after:
-                            for d in self.write_vars(instr):
-                                if v != d and not graph.has_edge(v, d):
+                        for d in locations.members(writes):
+                            for v in locations.members(l_after & ~locations.bit(d)):
+                                if not graph.has_edge(v, d):
                                     graph.add_edge(v, d)
 
         return graph
@@ -864,70 +1607,437 @@ class Compiler:
     # Allocate Registers
     ############################################################################
 
-    # select spill candidate by most neighbors
-    def find_spill(self, graph: UndirectedAdjList) -> location:
-        most_neighbors = list(graph.vertices())[0]
-        for v in graph.vertices():
-            if len(graph.adjacent(v)) > len(graph.adjacent(most_neighbors)):
-                most_neighbors = v
-
-        return v
-
+    # Registers in the graph are not colored, but those among the colors
+    # keep their neighbors from using them.
+    # With spill costs given, a variable left without a color may take
+    # the color of a cheaper neighbor, which is spilled instead. With a
+    # move graph, variables prefer the colors of their move partners, and
+    # variables in prefer take one of the colors given there if they can.
     def color_graph(
-        self, graph: UndirectedAdjList, colors: set[location]
+        self, graph: UndirectedAdjList, colors: list[location],
+        spill_cost: dict[location, float] = None,
+        moves: UndirectedAdjList = None,
+        prefer: dict[Variable, list[location]] = None
     ) -> dict[Variable, arg]:
-        coloring = {}
-
-        orig_graph = copy.deepcopy(graph)
-
-        k = len(colors)
-        stack = []
+        return saturation_coloring(graph, colors, lambda v: isinstance(v, Reg),
+                                   spill_cost, moves, prefer)
+
+    # The cost of spilling each variable: its uses and defs, each weighted
+    # by 10 to the loop depth of its block, divided by its degree in the
+    # interference graph. Uses the liveness masks of uncover_live_blocks.
+    def spill_costs(self, graph: UndirectedAdjList) -> dict[location, float]:
+        if 'start' in self.cfg.vertices():
+            depths = loop_depths(self.cfg, 'start')
+        else:
+            depths = {}
+
+        costs = {}
+        for block_id, masks in self.block_masks.items():
+            weight = 10 ** depths.get(block_id, 0)
+            for (reads, writes) in masks:
+                for v in self.locations.members(reads | writes):
+                    if isinstance(v, Variable):
+                        costs[v] = costs.get(v, 0) + weight
+
+        return {v: c / max(1, graph.degree(v)) for (v, c) in costs.items()}
+
+    # Gives the variables left without a register their stack slots by
+    # coloring them again over the interference graph, so that variables
+    # that do not interfere share a slot. The coloring is greedy, in order
+    # of first appearance, which is close to the order the variables
+    # become live in.
+    def assign_stack_slots(self, graph: UndirectedAdjList, home: dict[Variable, arg]) -> dict[Variable, arg]:
+        spilled = [v for v in self.locations.locations
+                   if isinstance(v, Variable) and v not in home]
+        slot_of = {}
+        for v in spilled:
+            taken = set()
+            if v in graph.vertices():
+                taken = set(slot_of[w] for w in graph.adjacent(v) if w in slot_of)
+            c = 0
+            while c in taken:
+                c += 1
+            slot_of[v] = c
+
+        slots = []
+        for _ in range(max(slot_of.values(), default=-1) + 1):
+            self.stack_size += 8
+            slots.append(Deref('rbp', -self.stack_size))
+        self.slots_saved = len(spilled) - len(slots)
+        if spilled:
+            trace(f'{len(spilled)} spilled variables share {len(slots)} stack slots')
+        return {v: slots[c] for (v, c) in slot_of.items()}
 
-        # for all vertices in the graph, select a vertex and remove it and put it on stack
-        while len(graph.vertices()) > 0:
-            # get vertex v with neighbors(v) < k
-            v = next(
-                filter(lambda v: len(graph.adjacent(v)) < k, graph.vertices()), None
-            )
+    ############################################################################
+    # Linear Scan
+    ############################################################################
 
-            # could not find vertex with neighbors(v) < k
-            if v is None:
-                potential_spill = self.find_spill(graph)
-                graph.remove_vertex(potential_spill)
-                stack.append(potential_spill)
-            # found vertex
+    # The blocks in reverse postorder of the control flow graph, so that a
+    # block mostly comes after its predecessors.
+    def linear_order(self, basic_blocks) -> list[str]:
+        succs = {block_id: [] for block_id in basic_blocks}
+        preds = {block_id: [] for block_id in basic_blocks}
+        for block_id in self.cfg.vertices():
+            for target in self.cfg.adjacent(block_id):
+                succs[block_id].append(target)
+                preds[target].append(block_id)
+        order = postorder(succs, preds)
+        order.reverse()
+        return order
+
+    # Builds the live intervals of the variables, and of the registers
+    # available for allocation, from the masks of uncover_live_blocks.
+    # Numbers the instructions along the way: self.first_point maps each
+    # block to the point of its first instruction.
+    def build_intervals(self, order, live_blocks) -> dict[location, LiveInterval]:
+        locations = self.locations
+        tracked = locations.mask(
+            loc for loc in list(locations.locations)
+            if isinstance(loc, Variable) or loc in registers_for_coloring)
+
+        intervals = {}
+        def interval(loc):
+            it = intervals.get(loc)
+            if it is None:
+                it = intervals[loc] = LiveInterval(loc)
+            return it
+
+        self.first_point = {}
+        point = 0
+        for block_id in order:
+            self.first_point[block_id] = point
+            opened = {}
+            live = 0
+            for (k, (reads, writes)) in enumerate(self.block_masks[block_id]):
+                l_after = live_blocks[block_id][k]
+                before = ((l_after & ~writes) | reads) & tracked
+                after = (l_after | writes) & tracked
+                for (mask, at) in ((before, point), (after, point + 1)):
+                    for loc in locations.members(live & ~mask):
+                        interval(loc).add_range(opened.pop(loc), at)
+                    for loc in locations.members(mask & ~live):
+                        opened[loc] = at
+                    live = mask
+                for loc in locations.members(reads & tracked):
+                    interval(loc).uses.append(point)
+                for loc in locations.members(writes & tracked):
+                    interval(loc).uses.append(point + 1)
+                point += 2
+            for (loc, start) in opened.items():
+                interval(loc).add_range(start, point)
+
+        return intervals
+
+    # Allocates the intervals in order of their start. An interval that
+    # finds no register free for its whole lifetime takes the one free the
+    # longest and is split where that register is next needed; the rest
+    # is allocated later. When no register is free, the interval whose
+    # next use is furthest away moves to its stack slot until that use.
+    # Returns the allocated intervals, including the pieces split off.
+    # Intervals that cross one of call_points prefer callee-saved registers.
+    def linear_scan(
+        self, intervals: dict[location, LiveInterval], call_points: list[int]
+    ) -> list[LiveInterval]:
+        unhandled = []
+        fixed = []
+        active = []
+        inactive = []
+        handled = []
+        slots = {}
+        counter = count()
+
+        def push(it):
+            heappush(unhandled, (it.start, next(counter), it))
+
+        for it in intervals.values():
+            if isinstance(it.loc, Reg):
+                it.home = it.loc
+                fixed.append(it)
             else:
-                graph.remove_vertex(v)
-                stack.append(v)
-
-        # for all vertices on stack, assign a color to them if possible
-        while len(stack) > 0:
-            d = stack.pop()
-
-            if isinstance(d, Reg):
-                continue
-
-            neighbors = orig_graph.adjacent(d)
-
-            # find available color not assigned to neighbors(d)
-            color = next(
-                filter(
-                    lambda c: not c in [coloring.get(u, None) for u in neighbors],
-                    colors,
-                ),
-                None,
-            )
+                push(it)
+
+        def slot(v):
+            if v not in slots:
+                self.stack_size += 8
+                slots[v] = Deref('rbp', -self.stack_size)
+            return slots[v]
+
+        # Moves it to its stack slot from the point at on, and back into a
+        # register from its next use after position.
+        def spill(it, at, position):
+            if at > it.start:
+                piece = it.split(at)
+                handled.append(piece)
+            else:
+                piece = it
+            piece.home = slot(piece.loc)
+            use = piece.next_use(position + 1)
+            if use < inf:
+                reload = use & ~1
+                if reload > max(piece.start, position):
+                    push(piece.split(reload))
+
+        def allocate_free(current, position) -> bool:
+            free_until = {r: inf for r in registers_for_coloring}
+            for it in active:
+                free_until[it.home] = 0
+            for it in inactive + fixed:
+                if free_until[it.home] > position:
+                    p = it.next_intersection(current)
+                    if p is not None:
+                        free_until[it.home] = min(free_until[it.home], p)
+
+            whole = [r for r in registers_for_coloring
+                     if free_until[r] >= current.end]
+            if whole:
+                if current.crosses(call_points):
+                    whole = [r for r in whole
+                             if r in callee_saved_registers] or whole
+                current.home = whole[0]
+                return True
+            reg = max(registers_for_coloring, key=lambda r: free_until[r])
+            until = free_until[reg]
+            # splits go between instructions, so that an instruction sees
+            # each of its operands in one place
+            at = until & ~1
+            if at <= position:
+                return False
+            current.home = reg
+            push(current.split(at))
+            return True
+
+        def allocate_blocked(current, position):
+            next_use = {r: inf for r in registers_for_coloring}
+            for it in active:
+                next_use[it.home] = min(next_use[it.home], it.next_use(position))
+            for it in inactive:
+                if it.next_intersection(current) is not None:
+                    next_use[it.home] = min(next_use[it.home], it.next_use(position))
+            blocked = {}
+            for it in fixed:
+                p = it.next_intersection(current)
+                if p is not None:
+                    blocked[it.home] = min(blocked.get(it.home, inf), p)
+                    next_use[it.home] = min(next_use[it.home], p)
+
+            reg = max(registers_for_coloring, key=lambda r: next_use[r])
+            at = blocked.get(reg, inf)
+            if current.next_use(position) > next_use[reg] \
+               or (at < inf and at & ~1 <= position):
+                spill(current, position, position)
+                return
+
+            current.home = reg
+            for it in [it for it in active if it.home == reg]:
+                active.remove(it)
+                spill(it, position & ~1, position)
+            for it in [it for it in inactive if it.home == reg]:
+                p = it.next_intersection(current)
+                if p is not None:
+                    spill(it, p & ~1, position)
+            if at < inf:
+                push(current.split(at & ~1))
+
+        while unhandled:
+            (position, _, current) = heappop(unhandled)
+            for it in list(active):
+                if it.end <= position:
+                    active.remove(it)
+                elif not it.covers(position):
+                    active.remove(it)
+                    inactive.append(it)
+            for it in list(inactive):
+                if it.end <= position:
+                    inactive.remove(it)
+                elif it.covers(position):
+                    inactive.remove(it)
+                    active.append(it)
+            fixed = [it for it in fixed if it.end > position]
+
+            handled.append(current)
+            if not allocate_free(current, position):
+                allocate_blocked(current, position)
+            if isinstance(current.home, Reg):
+                active.append(current)
+
+        return handled
+
+    # Orders a parallel move so that no location is overwritten before it
+    # is read, breaking cycles through a scratch stack slot.
+    def sequentialize(self, moves: list[tuple[arg, arg]]) -> list[instr]:
+        pending = [(s, d) for (s, d) in moves if s != d]
+        result = []
+        while pending:
+            sources = set(s for (s, _) in pending)
+            ready = [(s, d) for (s, d) in pending if d not in sources]
+            if ready:
+                result += [Instr('movq', [s, d]) for (s, d) in ready]
+                pending = [(s, d) for (s, d) in pending if d in sources]
+            else:
+                if self.scratch is None:
+                    self.stack_size += 8
+                    self.scratch = Deref('rbp', -self.stack_size)
+                s = pending[0][0]
+                result.append(Instr('movq', [s, self.scratch]))
+                pending = [(self.scratch if s2 == s else s2, d)
+                           for (s2, d) in pending]
+        return result
 
-            # if colorable, assign the color
-            if color != None:
-                coloring[d] = color
+    # Linear scan version of assign_homes. A variable may live in
+    # different places over its lifetime, so moves are inserted where one
+    # piece of its interval ends and the next begins, and on the control
+    # flow edges whose ends disagree on where a variable is.
+    def assign_homes_linear(self, p: X86Program) -> X86Program:
+        # for liveness analysis there needs to be a dummy block for conclusion
+        p.body['conclusion'] = []
 
-        return coloring
+        live_blocks = self.uncover_live_blocks(p.body)
+        order = self.linear_order(p.body)
+        intervals = self.build_intervals(order, live_blocks)
+        across = self.live_across_calls(p, live_blocks)
+        call_points = sorted(
+            self.first_point[block_id] + 2 * k + 1
+            for block_id, instrs in p.body.items()
+            for (k, i) in enumerate(instrs)
+            if isinstance(i, Callq))
+        pieces = [it for it in self.linear_scan(intervals, call_points)
+                  if isinstance(it.loc, Variable)]
+        pieces.sort(key=lambda it: it.start)
+        self.scratch = None
+
+        homes: dict[Variable, list[LiveInterval]] = {}
+        for it in pieces:
+            homes.setdefault(it.loc, []).append(it)
+        starts = {v: [it.start for it in its] for (v, its) in homes.items()}
+
+        def home_at(v, point):
+            return homes[v][bisect_right(starts[v], point) - 1].home
+
+        self.spilled = {}
+        block_starts = set(self.first_point.values())
+        moves_at = {}
+        for (v, its) in homes.items():
+            for (a, b) in zip(its, its[1:]):
+                if isinstance(b.home, Deref):
+                    self.spilled[v] = self.spilled.get(v, 0) + 1
+                if b.start % 2 == 0 and b.start not in block_starts \
+                   and a.home != b.home:
+                    moves_at.setdefault(b.start, []).append((a.home, b.home))
+            if isinstance(its[0].home, Deref):
+                self.spilled[v] = self.spilled.get(v, 0) + 1
+        for (v, n) in self.spilled.items():
+            trace(f'spilled {v} in {n} pieces')
+
+        variables = self.locations.mask(
+            loc for loc in list(self.locations.locations)
+            if isinstance(loc, Variable))
+        def live_before(block_id, k):
+            (reads, writes) = self.block_masks[block_id][k]
+            l_after = live_blocks[block_id][k]
+            return ((l_after & ~writes) | reads) & variables
+
+        self.collect_roots(p, live_blocks)
+        self.saves = {}
+        new_body = {}
+        for (block_id, instrs) in p.body.items():
+            first = self.first_point[block_id]
+            new_instrs = []
+            for (k, i) in enumerate(instrs):
+                point = first + 2 * k
+                if i in across:
+                    self.saves[i] = self.call_saves(
+                        home_at(v, point + 1) if isinstance(v, Variable) else v
+                        for v in across[i])
+                new_instrs += self.sequentialize(moves_at.get(point, []))
+                (reads, writes) = self.block_masks[block_id][k]
+                home = {}
+                for v in self.locations.members(reads & variables):
+                    home[v] = home_at(v, point)
+                for v in self.locations.members(writes & variables):
+                    home[v] = home_at(v, point + 1)
+                if isinstance(i, Callq) and i.func == 'collect':
+                    for v in self.roots[i]:
+                        home[v] = home_at(v, point)
+                new_instrs += self.assign_homes_instr(i, home)
+            new_body[block_id] = new_instrs
+
+        # resolve the control flow edges
+        succs = {block_id: [] for block_id in p.body}
+        num_preds = {block_id: 0 for block_id in p.body}
+        for block_id in self.cfg.vertices():
+            for target in self.cfg.adjacent(block_id):
+                succs[block_id].append(target)
+                num_preds[target] += 1
+        for (block_id, targets) in succs.items():
+            last = self.first_point[block_id] + 2 * len(p.body[block_id]) - 1
+            for target in targets:
+                if not p.body[target]:
+                    continue
+                entry = self.first_point[target]
+                moves = [(home_at(v, last), home_at(v, entry))
+                         for v in self.locations.members(live_before(target, 0))]
+                moves = self.sequentialize(moves)
+                if not moves:
+                    continue
+                if num_preds[target] == 1:
+                    new_body[target] = moves + new_body[target]
+                elif len(targets) == 1:
+                    instrs = new_body[block_id]
+                    k = len(instrs)
+                    while k > 0 and isinstance(instrs[k - 1], Jump | JumpIf):
+                        k -= 1
+                    new_body[block_id] = instrs[:k] + moves + instrs[k:]
+                else:
+                    # a critical edge gets a block of its own
+                    edge = label_name(generate_name('block'))
+                    new_body[edge] = moves + [Jump(target)]
+                    new_body[block_id] = [
+                        Jump(edge) if isinstance(i, Jump) and i.label == target
+                        else JumpIf(i.cc, edge)
+                        if isinstance(i, JumpIf) and i.label == target
+                        else i
+                        for i in new_body[block_id]]
+
+        # the empty conclusion stays last, where running off its end
+        # ends the program
+        new_body['conclusion'] = new_body.pop('conclusion')
+        return X86Program(new_body)
 
     ############################################################################
     # Assign Homes
     ############################################################################
 
+    # The tuple variables live across each call to collect, which are the
+    # roots of the collection. Each root gets the same root stack slot at
+    # every site; roots live at the same site get different slots, chosen
+    # greedily. Sets self.roots, self.root_slots and self.root_stack_size.
+    def collect_roots(self, p: X86Program, live_blocks):
+        self.roots = {}
+        conflicts = {}
+        for block_id, instrs in p.body.items():
+            for (k, i) in enumerate(instrs):
+                if isinstance(i, Callq) and i.func == 'collect':
+                    roots = [v for v in self.locations.members(live_blocks[block_id][k])
+                             if isinstance(v, Variable)
+                             and isinstance(self.env[v.id], TupleType)]
+                    self.roots[i] = roots
+                    for v in roots:
+                        conflicts.setdefault(v, set()).update(roots)
+
+        self.root_slots = {}
+        for (v, others) in conflicts.items():
+            taken = set(self.root_slots[w] for w in others if w in self.root_slots)
+            slot = 0
+            while slot in taken:
+                slot += 1
+            self.root_slots[v] = slot
+        self.root_stack_size = max(self.root_slots.values(), default=-1) + 1
+
+    # The root stack slot with the given index. r15 points just past the
+    # root stack frame, which holds root_stack_size slots.
+    def root_slot(self, slot: int) -> Deref:
+        return Deref('r15', -8 * (slot + 1))
+
     def assign_homes_arg(self, a: arg, home: dict[Variable, arg]) -> arg:
         match a:
             case Variable(_):
@@ -953,18 +2063,20 @@ class Compiler:
             case Callq('read_int', 0) | Callq('print_int', 1):
                 return [i]
             case Callq('collect', 1):
-                movRootStack = []
-                
-                self.root_stack_size = 0
-                for var in home:
-                    if isinstance(var, Variable):
-                        varName = var.id
-                        varType = self.env[varName]
-                        if isinstance(varType, TupleType):
-                            movRootStack += [Instr('movq', [home[var], Deref('r15', -8 * self.root_stack_size)])]
-                            self.root_stack_size += 1
-                
-                return movRootStack + [i];
+                # store the live roots, clearing the slots of the others so
+                # the collector does not follow stale pointers, and reload
+                # the roots afterwards, as their tuples may have moved
+                roots = {self.root_slots[v]: v for v in self.roots[i]}
+                store = []
+                reload = []
+                for slot in range(self.root_stack_size):
+                    if slot in roots:
+                        loc = self.assign_homes_arg(roots[slot], home)
+                        store.append(Instr('movq', [loc, self.root_slot(slot)]))
+                        reload.append(Instr('movq', [self.root_slot(slot), loc]))
+                    else:
+                        store.append(Instr('movq', [Immediate(0), self.root_slot(slot)]))
+                return store + [i] + reload
             case _:
                 return [i]
 
@@ -975,12 +2087,32 @@ class Compiler:
         return result
 
     def assign_homes(self, p: X86Program) -> X86Program:
+        if self.allocator == 'linear_scan':
+            return self.assign_homes_linear(p)
+
         # for liveness analysis there needs to be a dummy block for conclusion
         p.body['conclusion'] = []
 
         live_blocks = self.uncover_live_blocks(p.body)
         rig = self.build_interference(p, live_blocks)
-        home = self.color_graph(rig, registers_for_coloring)
+        costs = self.spill_costs(rig)
+        moves = self.build_move_graph(p, rig)
+        # variables live across a call go to callee-saved registers, which
+        # need no saving around the call
+        across = self.live_across_calls(p, live_blocks)
+        callee = [r for r in registers_for_coloring if r in callee_saved_registers]
+        prefer = {v: callee for locs in across.values() for v in locs
+                  if isinstance(v, Variable)}
+        home = self.color_graph(rig, registers_for_coloring, costs, moves, prefer)
+        self.saves = {i: self.call_saves(home.get(v, v) for v in locs)
+                      for (i, locs) in across.items()}
+
+        self.spilled = {v: costs.get(v, 0) for v in rig.vertices()
+                        if isinstance(v, Variable) and v not in home}
+        for (v, cost) in self.spilled.items():
+            trace(f'spilled {v} with spill cost {cost:.2f}')
+        home.update(self.assign_stack_slots(rig, home))
+        self.collect_roots(p, live_blocks)
 
         new_body = {}
         for block_id, instrs in p.body.items():
@@ -1036,7 +2168,8 @@ class Compiler:
                     Instr(op, [Reg('rax'), Deref(reg2, offset2)]),
                 ]
             case Callq(name, n):
-                return self.save(caller_saved_registers) + [i] + self.restore(caller_saved_registers)
+                saved = self.saves[i]
+                return self.save(saved) + [i] + self.restore(saved)
             case _:
                 return [i]
 
@@ -1055,11 +2188,251 @@ class Compiler:
 
         return X86Program(new_body)
 
+    ###########################################################################
+    # Peephole
+    ###########################################################################
+
+    # The register a byte register is part of; only al is used.
+    def full_register(self, r: Reg) -> str:
+        return 'rax' if isinstance(r, ByteReg) else r.id
+
+    # The registers read to evaluate an operand, and those read only to
+    # address it when it is written.
+    def operand_regs(self, a: arg) -> set[str]:
+        match a:
+            case Reg(_):
+                return set([self.full_register(a)])
+            case Deref(reg, _):
+                return set([reg])
+            case _:
+                return set()
+
+    def address_regs(self, a: arg) -> set[str]:
+        match a:
+            case Deref(reg, _):
+                return set([reg])
+            case _:
+                return set()
+
+    # The registers an instruction reads and writes. Unlike read_vars and
+    # write_vars these are exact for allocated code: memory operands read
+    # their base register and a call reads its argument registers.
+    def peephole_reads(self, i: instr) -> set[str]:
+        match i:
+            case Instr('movq' | 'movzbq', [s, d]):
+                return self.operand_regs(s) | self.address_regs(d)
+            case Instr(_, [s, d]):
+                return self.operand_regs(s) | self.operand_regs(d)
+            case Instr('pushq', [d]):
+                return self.operand_regs(d) | set(['rsp'])
+            case Instr('popq', [d]):
+                return self.address_regs(d) | set(['rsp'])
+            case Instr(_, [d]):
+                return self.operand_regs(d)
+            case Callq(func, n):
+                # collect also takes the number of bytes needed in rsi
+                n = max(n, 2) if func == 'collect' else n
+                return set(['rdi', 'rsi', 'rdx', 'rcx', 'r8', 'r9'][:n] + ['rsp'])
+            case _:
+                return set()
+
+    def peephole_writes(self, i: instr) -> set[str]:
+        match i:
+            case Instr('cmpq', _):
+                return set()
+            case Instr('pushq', _):
+                return set(['rsp'])
+            case Instr('popq', [d]):
+                return set(['rsp']) | self.operand_regs(d) - self.address_regs(d)
+            case Instr(_, [*_, ByteReg(_)]):
+                # set<cc> %al keeps the rest of rax, so it kills nothing
+                return set()
+            case Instr(_, [*_, Reg(_) as d]):
+                return set([self.full_register(d)])
+            case Callq(_, _):
+                return set(['rax'])
+            case _:
+                return set()
+
+    # The registers live after each instruction, by block. At the end of
+    # the program rax holds the result and the frame registers are still
+    # needed by the conclusion.
+    def peephole_liveness(self, p: X86Program) -> dict[str, list[set[str]]]:
+        cfg = DirectedAdjList()
+        for (block_id, instrs) in p.body.items():
+            cfg.add_vertex(block_id)
+            for i in instrs:
+                match i:
+                    case Jump(label) | JumpIf(_, label):
+                        cfg.add_edge(block_id, label)
+
+        live_after = {}
+
+        def transfer(block_id, live_out):
+            if block_id == 'conclusion':
+                live_out = set(['rax', 'rsp', 'rbp', 'r15'])
+            live = live_out
+            afters = []
+            for i in reversed(p.body[block_id]):
+                afters.append(live)
+                if isinstance(i, JumpIf):
+                    live = live | live_out
+                else:
+                    live = (live - self.peephole_writes(i)) | self.peephole_reads(i)
+            afters.reverse()
+            live_after[block_id] = afters
+            return live
+
+        analyze_dataflow(cfg, transfer, set(), lambda a, b: a | b,
+                         direction='backward')
+        return live_after
+
+    # Whether the flags are overwritten after position k before anything
+    # reads them. Comparisons are always in the same block as the jump or
+    # set that reads them.
+    def flags_dead(self, instrs: list[instr], k: int) -> bool:
+        for i in instrs[k + 1:]:
+            match i:
+                case JumpIf(_, _):
+                    return False
+                case Instr(op, _) if op.startswith('set'):
+                    return False
+                case Instr('cmpq' | 'addq' | 'subq' | 'xorq' | 'andq' | 'negq' | 'sarq', _):
+                    return True
+                case Callq(_, _) | Jump(_):
+                    return True
+        return True
+
+    # Each rule looks at the instructions from position k and returns
+    # how many of them it replaces and with what, or None.
+
+    # movq x, m; movq m, y  =>  movq x, m; movq x, y
+    def peephole_store_reload(self, instrs, k, live_after):
+        match instrs[k:k + 2]:
+            case [Instr('movq', [Reg(_) | Immediate(_) as x, Deref(_, _) as m]) as store,
+                  Instr('movq', [Deref(_, _) as m2, y])] if m == m2:
+                return (2, [store] if x == y else [store, Instr('movq', [x, y])])
+        return None
+
+    # movq a, t; movq t, b  =>  movq a, b  when t is dead afterwards
+    def peephole_move_chain(self, instrs, k, live_after):
+        match instrs[k:k + 2]:
+            case [Instr('movq', [a, Reg(_) as t]), Instr('movq', [t2, b])] \
+                    if t == t2 and not isinstance(t, ByteReg) \
+                    and t.id not in live_after[k + 1] \
+                    and t.id not in self.address_regs(b) \
+                    and not (isinstance(b, Deref) and not self.fits_memory_move(a)):
+                return (2, [] if a == b else [Instr('movq', [a, b])])
+        return None
+
+    # Whether a movq from a can store straight to memory: neither another
+    # memory operand nor an immediate wider than 32 bits.
+    def fits_memory_move(self, a: arg) -> bool:
+        match a:
+            case Deref(_, _):
+                return False
+            case Immediate(n):
+                return -2**31 <= n < 2**31
+            case _:
+                return True
+
+    # movq $0, r  =>  xorq r, r
+    def peephole_zero_xor(self, instrs, k, live_after):
+        match instrs[k]:
+            case Instr('movq', [Immediate(0), Reg(_) as r]) \
+                    if not isinstance(r, ByteReg) and self.flags_dead(instrs, k):
+                return (1, [Instr('xorq', [r, r])])
+        return None
+
+    # negq r; ...; addq r, d  =>  ...; subq r, d  when r is dead afterwards,
+    # the instructions in between do not touch r or the flags, and nothing
+    # reads the flags, whose carry and overflow differ, after the addq
+    def peephole_neg_add(self, instrs, k, live_after):
+        match instrs[k]:
+            case Instr('negq', [Reg(_) as r]):
+                for j in range(k + 1, min(k + 5, len(instrs))):
+                    match instrs[j]:
+                        case Instr('addq', [r2, d]) if r2 == r and d != r \
+                                and r.id not in live_after[j] \
+                                and r.id not in self.address_regs(d) \
+                                and self.flags_dead(instrs, j):
+                            return (j - k + 1, instrs[k + 1:j] + [Instr('subq', [r, d])])
+                        case Instr(op, _) if not op.startswith('set') \
+                                and r.id not in self.peephole_reads(instrs[j]) \
+                                and r.id not in self.peephole_writes(instrs[j]):
+                            continue
+                    break
+        return None
+
+    # addq $0, x or subq $0, x  =>  nothing
+    def peephole_add_zero(self, instrs, k, live_after):
+        match instrs[k]:
+            case Instr('addq' | 'subq', [Immediate(0), _]) if self.flags_dead(instrs, k):
+                return (1, [])
+        return None
+
+    peephole_rules = [
+        ('store_reload', peephole_store_reload),
+        ('move_chain', peephole_move_chain),
+        ('zero_xor', peephole_zero_xor),
+        ('neg_add', peephole_neg_add),
+        ('add_zero', peephole_add_zero),
+    ]
+
+    def peephole_block(self, instrs: list[instr], live_after: list[set[str]]) -> list[instr]:
+        result = []
+        k = 0
+        while k < len(instrs):
+            for (name, rule) in self.peephole_rules:
+                if name not in self.peephole_enabled:
+                    continue
+                rewrite = rule(self, instrs, k, live_after)
+                if rewrite is not None:
+                    (n, new_instrs) = rewrite
+                    self.peephole_stats[name]['applied'] += 1
+                    self.peephole_stats[name]['removed'] += n - len(new_instrs)
+                    result += new_instrs
+                    k += n
+                    break
+            else:
+                result.append(instrs[k])
+                k += 1
+        return result
+
+    # Rewrites short instruction sequences with the enabled rules until
+    # none applies, recomputing liveness after every round. How often each
+    # rule applied and how many instructions it removed accumulate in
+    # self.peephole_stats.
+    def peephole(self, p: X86Program) -> X86Program:
+        applied = lambda: sum(s['applied'] for s in self.peephole_stats.values())
+        body = p.body
+        while True:
+            before = applied()
+            live_after = self.peephole_liveness(X86Program(body))
+            body = {block_id: self.peephole_block(instrs, live_after[block_id])
+                    for (block_id, instrs) in body.items()}
+            if applied() == before:
+                return X86Program(body)
+
     ###########################################################################
     # Prelude & Conclusion
     ###########################################################################
 
     def prelude_and_conclusion(self, p: X86Program) -> X86Program:
+        # the callee-saved registers the program uses, r15 always, get
+        # slots below the frame
+        used = set([Reg('r15')])
+        for instrs in p.body.values():
+            for i in instrs:
+                if isinstance(i, Instr):
+                    used.update(a for a in i.args if isinstance(a, Reg))
+        saved = [r for r in [Reg('rbx'), Reg('r12'), Reg('r13'), Reg('r14'), Reg('r15')]
+                 if r in used]
+        slots = []
+        for r in saved:
+            self.stack_size += 8
+            slots.append(Deref('rbp', -self.stack_size))
+
         adjust_stack_size = (
             self.stack_size if self.stack_size % 16 == 0 else self.stack_size + 8
         )
@@ -1071,7 +2444,9 @@ class Compiler:
         
         if adjust_stack_size > 0:
             prelude.append(Instr('subq', [Immediate(adjust_stack_size), Reg('rsp')]))
-            
+
+        prelude += [Instr('movq', [r, slot]) for (r, slot) in zip(saved, slots)]
+
         prelude += [
             Instr('movq', [Immediate(16384), Reg('rdi')]),
             Instr('movq', [Immediate(16384), Reg('rsi')]),
@@ -1087,21 +2462,29 @@ class Compiler:
                 Instr('addq', [Immediate(self.root_stack_size * 8), Reg('r15')])
             ]
 
-        p.body['main'] = prelude + [Jump('start')]
-        conclusion = [Instr('popq', [Reg('rbp')]), Instr('retq', [])]
+        conclusion = []
 
         if self.root_stack_size > 0:
-            conclusion.insert(
-                0, Instr('subq', [Immediate(self.root_stack_size * 8), Reg('r15')])
+            conclusion.append(
+                Instr('subq', [Immediate(self.root_stack_size * 8), Reg('r15')])
             )
 
+        conclusion += [Instr('movq', [slot, r]) for (r, slot) in zip(saved, slots)]
+
         if adjust_stack_size > 0:
-            conclusion.insert(
-                0, Instr('addq', [Immediate(adjust_stack_size), Reg('rsp')])
+            conclusion.append(
+                Instr('addq', [Immediate(adjust_stack_size), Reg('rsp')])
             )
 
-        p.body['conclusion'] = conclusion
-        return X86Program(p.body)
+        conclusion += [Instr('popq', [Reg('rbp')]), Instr('retq', [])]
+
+        # main comes first so that it falls through to start, and the
+        # conclusion last
+        body = {'main': prelude + [Jump('start')]}
+        body.update((label, instrs) for (label, instrs) in p.body.items()
+                    if label != 'conclusion')
+        body['conclusion'] = conclusion
+        return X86Program(body)
 
     ##################################################
     # Compiler
@@ -1110,12 +2493,17 @@ class Compiler:
     def compile(self, s: str, logging=False) -> X86Program:
         compiler_passes = {
             'shrink': self.shrink,
+            'fold constants': self.fold_constants,
             'expose allocation': self.expose_allocation,
             'remove complex operands': self.remove_complex_operands,
             'explicate control': self.explicate_control,
+            'number values': self.number_values,
+            'remove dead code': self.remove_dead_code,
             'select instructions': self.select_instructions,
+            'layout blocks': self.layout_blocks,
             'assign homes': self.assign_homes,
             'patch instructions': self.patch_instructions,
+            'peephole': self.peephole,
             'prelude & conclusion': self.prelude_and_conclusion,
         }
 
@@ -1,22 +1,77 @@
-from collections import deque
-from graph import transpose
-from functools import reduce
+from heapq import heappush, heappop
 from utils import trace
 
-def analyze_dataflow(G, transfer, bottom, join):
-    trans_G = transpose(G)
-    mapping = {}
-    for v in G.vertices():
-        mapping[v] = bottom
-    worklist = deque()
-    for v in G.vertices():
-        worklist.append(v)
+# Solves a dataflow problem over the graph G by chaotic iteration with a
+# priority worklist.
+#
+# transfer(node, input) computes the output of a node from the join of
+# the outputs flowing into it. With direction='forward' information flows
+# along the edges of G; with direction='backward' (e.g. liveness over a
+# control-flow graph) it flows against them. Nodes are visited in reverse
+# postorder of the flow, or in postorder with order='postorder', and a
+# node is never queued twice.
+#
+# The lattice is given by bottom, join and equal. The transfer functions
+# must be monotone: inputs are joined incrementally as outputs change,
+# which relies on outputs only ever growing.
+#
+# Returns the output of every node.
+def analyze_dataflow(G, transfer, bottom, join, equal=lambda a, b: a == b,
+                     direction='forward', order='rpo'):
+    succs = {v: [] for v in G.vertices()}
+    preds = {v: [] for v in G.vertices()}
+    for u in G.vertices():
+        for v in G.adjacent(u):
+            if direction == 'forward':
+                succs[u].append(v)
+                preds[v].append(u)
+            else:
+                succs[v].append(u)
+                preds[u].append(v)
+
+    post = postorder(succs, preds)
+    if order == 'rpo':
+        post.reverse()
+    elif order != 'postorder':
+        raise Exception('analyze_dataflow: unknown order ' + repr(order))
+    priority = {v: i for (i, v) in enumerate(post)}
+
+    inputs = {v: bottom for v in succs}
+    outputs = {v: bottom for v in succs}
+    worklist = [(priority[v], v) for v in post]
+    queued = set(succs)
     while worklist:
-        node = worklist.pop()
-        input = reduce(join, [mapping[v] for v in trans_G.adjacent(node)], bottom)
-        output = transfer(node, input)
-        if output != mapping[node]:
-            mapping[node] = output
-            for v in G.adjacent(node):
-                worklist.append(v)
+        (_, node) = heappop(worklist)
+        queued.remove(node)
+        output = transfer(node, inputs[node])
+        if not equal(output, outputs[node]):
+            outputs[node] = output
+            for v in succs[node]:
+                inputs[v] = join(inputs[v], output)
+                if v not in queued:
+                    queued.add(v)
+                    heappush(worklist, (priority[v], v))
+    return outputs
 
+# Depth-first postorder along succs, starting from the nodes without
+# predecessors and then from any nodes only reachable through cycles.
+def postorder(succs, preds) -> list:
+    visited = set()
+    result = []
+    roots = [v for v in succs if not preds[v]] + list(succs)
+    for root in roots:
+        if root in visited:
+            continue
+        visited.add(root)
+        stack = [(root, iter(succs[root]))]
+        while stack:
+            (node, children) = stack[-1]
+            for child in children:
+                if child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(succs[child])))
+                    break
+            else:
+                stack.pop()
+                result.append(node)
+    return result
@@ -1,4 +1,7 @@
+from array import array
+from bisect import bisect_left
 from collections import deque
+from heapq import heapify, heappop, heappush
 
 class Edge:
     def __init__(self, src, tgt):
@@ -26,12 +29,18 @@ Vertex = any
 # Directed Adjacency List
 ################################################################################
 
+# Vertices are numbered with dense integer ids in the order they are
+# added; adjacency is kept as sets of ids, so has_edge does not allocate
+# and removing a vertex is linear in its degree. Ids of removed vertices
+# are not reused.
 class DirectedAdjList:
     def __init__(self, edge_list=[], vertex_label=None,
                  vertex_text=None,
                  edge_label=None, edge_color=None):
-        self.out = {}
-        self.ins = {}
+        self.ids = {}
+        self.names = []
+        self.out = []
+        self.ins = []
         self.vertex_label = vertex_label
         if vertex_text:
             self.vertex_text = vertex_text
@@ -41,7 +50,6 @@ class DirectedAdjList:
             self.vertex_text = lambda v: str(v)
         self.edge_label = edge_label
         self.edge_color = edge_color
-        self.edge_set = set()
         for e in edge_list:
           if isinstance(e, Edge):
             self.add_edge(e.source, e.target)
@@ -49,60 +57,75 @@ class DirectedAdjList:
             self.add_edge(e[0], e[1])
 
     def edges(self):
-        return self.edge_set
+        names = self.names
+        return set(Edge(names[i], names[j])
+                   for i in self.ids.values() for j in self.out[i])
 
     def vertices(self):
-        #return range(0, self.num_vertices())
-        return self.out.keys()
+        return self.ids.keys()
 
     def num_vertices(self):
-        return len(self.out)
+        return len(self.ids)
+
+    def id(self, u) -> int:
+        i = self.ids.get(u)
+        if i is None:
+            i = self.ids[u] = len(self.names)
+            self.names.append(u)
+            self.out.append(set())
+            self.ins.append(set())
+        return i
 
     def adjacent(self, u):
-        self.add_vertex(u)
-        return self.out[u]
+        names = self.names
+        return [names[j] for j in self.out[self.id(u)]]
+
+    def degree(self, u) -> int:
+        return len(self.out[self.id(u)])
 
     def add_vertex(self, u):
-        if u not in self.out:
-            self.out[u] = []
-            self.ins[u] = []
+        self.id(u)
 
     def add_edge(self, u, v):
-        self.add_vertex(u)
-        self.add_vertex(v)
-        self.out[u].append(v)
-        self.ins[v].append(u)
-        edge = Edge(u,v)
-        self.edge_set.add(edge)
-        return edge
+        i = self.id(u)
+        j = self.id(v)
+        self.out[i].add(j)
+        self.ins[j].add(i)
+        return Edge(u, v)
 
     def out_edges(self, u):
-        for v in self.out[u]:
+        for v in self.adjacent(u):
             yield Edge(u, v)
 
     def in_edges(self, v):
-        for u in self.ins[v]:
-            yield Edge(u, v)
+        names = self.names
+        for i in self.ins[self.ids[v]]:
+            yield Edge(names[i], v)
 
     def has_edge(self, u, v):
-        return Edge(u,v) in self.edge_set
+        i = self.ids.get(u)
+        j = self.ids.get(v)
+        return i is not None and j is not None and j in self.out[i]
 
     def remove_edge(self, u, v):
-        self.out[u].remove(v)
-        self.ins[v].remove(u)
-        self.edge_set.remove(Edge(u,v))
+        i = self.ids[u]
+        j = self.ids[v]
+        self.out[i].remove(j)
+        self.ins[j].remove(i)
 
     def remove_vertex(self, u):
-        for v in self.ins[u]:
-            self.out[v].remove(u)
-            self.edge_set.remove(Edge(v, u))
-
-        for v in self.out[u]:
-            self.ins[v].remove(u)
-            self.edge_set.remove(Edge(u, v))
-
-        del self.out[u]
-        del self.ins[u]
+        i = self.ids.pop(u)
+        for j in self.ins[i]:
+            self.out[j].discard(i)
+        for j in self.out[i]:
+            self.ins[j].discard(i)
+        self.out[i] = set()
+        self.ins[i] = set()
+        self.names[i] = None
+
+    # A read-only copy in compressed sparse row form.
+    def freeze(self) -> 'CSRGraph':
+        return CSRGraph(self)
 
     def name(self, u):
         if self.vertex_label:
@@ -150,40 +173,42 @@ class UEdge(Edge):
 # Undirected Adjacency List
 ################################################################################
 
+# Each edge is kept in the out set of both of its ends; ins is unused.
 class UndirectedAdjList(DirectedAdjList):
 
+    def edges(self):
+        names = self.names
+        return set(UEdge(names[i], names[j])
+                   for i in self.ids.values() for j in self.out[i] if i <= j)
+
     def add_edge(self, u, v):
-        self.add_vertex(u)
-        self.add_vertex(v)
-        self.out[u].append(v)
-        self.out[v].append(u)
-        edge = UEdge(u,v)
-        self.edge_set.add(edge)
-        return edge
+        i = self.id(u)
+        j = self.id(v)
+        self.out[i].add(j)
+        self.out[j].add(i)
+        return UEdge(u, v)
 
     def remove_edge(self, u, v):
-        self.out[u] = [w for w in self.out[u] if w != v]
-        self.out[v] = [w for w in self.out[v] if w != u]
-        self.edge_set.remove(UEdge(u,v))
+        i = self.ids[u]
+        j = self.ids[v]
+        self.out[i].remove(j)
+        self.out[j].discard(i)
 
     def remove_vertex(self, u):
-        for v in self.out[u]:
-            self.out[v].remove(u)
-            self.edge_set.remove(UEdge(v, u))
-
-        del self.out[u]
+        i = self.ids.pop(u)
+        for j in self.out[i]:
+            self.out[j].discard(i)
+        self.out[i] = set()
+        self.names[i] = None
 
     def out_edges(self, u):
-        for v in self.out[u]:
+        for v in self.adjacent(u):
             yield UEdge(u, v)
 
     def in_edges(self, v):
-        for u in self.out[v]:
+        for u in self.adjacent(v):
             yield UEdge(u,v)
 
-    def has_edge(self, u, v):
-        return UEdge(u,v) in self.edge_set
-
     # def remove_edge(self, u, v):
     #     self.out[u] = [w for w in self.out[u] if w != v]
     #     self.edge_set.remove(UEdge(u,v))
@@ -198,14 +223,68 @@ class UndirectedAdjList(DirectedAdjList):
       return dot
 
 
+################################################################################
+# Compressed Sparse Row Graph
+################################################################################
+
+# A frozen graph for read-only traversal. The neighbors of the vertex
+# with id i are targets[offsets[i]:offsets[i+1]], sorted, so has_edge is
+# a binary search. Ids are renumbered densely in vertex order.
+class CSRGraph:
+    def __init__(self, graph: DirectedAdjList):
+        self.names = list(graph.vertices())
+        self.ids = {u: i for (i, u) in enumerate(self.names)}
+        self.vertex_label = graph.vertex_label
+        renumber = {graph.ids[u]: i for (i, u) in enumerate(self.names)}
+        self.offsets = array('l', [0])
+        self.targets = array('l')
+        for u in self.names:
+            self.targets.extend(sorted(renumber[j]
+                                       for j in graph.out[graph.ids[u]]))
+            self.offsets.append(len(self.targets))
+
+    def vertices(self):
+        return self.ids.keys()
+
+    def num_vertices(self):
+        return len(self.names)
+
+    def neighbor_ids(self, i: int):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def adjacent(self, u):
+        names = self.names
+        return [names[j] for j in self.neighbor_ids(self.ids[u])]
+
+    def degree(self, u) -> int:
+        i = self.ids[u]
+        return self.offsets[i + 1] - self.offsets[i]
+
+    def has_edge(self, u, v):
+        i = self.ids.get(u)
+        j = self.ids.get(v)
+        if i is None or j is None:
+            return False
+        lo = self.offsets[i]
+        hi = self.offsets[i + 1]
+        k = bisect_left(self.targets, j, lo, hi)
+        return k < hi and self.targets[k] == j
+
+    def edges(self):
+        names = self.names
+        return set(Edge(names[i], names[j])
+                   for i in range(len(names)) for j in self.neighbor_ids(i))
+
+
 ################################################################################
 # Topological Sort
 ################################################################################
 
 def topological_sort(G: DirectedAdjList) -> [Vertex]:
     in_degree = {u: 0 for u in G.vertices()}
-    for e in G.edges():
-        in_degree[e.target] += 1
+    for u in G.vertices():
+        for v in G.adjacent(u):
+            in_degree[v] += 1
     queue = deque()
     for u in G.vertices():
         if in_degree[u] == 0:
@@ -220,6 +299,189 @@ def topological_sort(G: DirectedAdjList) -> [Vertex]:
                 queue.append(v)
     return topo
 
+################################################################################
+# Graph Coloring
+################################################################################
+
+# DSatur coloring of an undirected graph with the given colors. Vertices
+# are colored in order of saturation (the number of distinct colors
+# among their neighbors), then degree, then the order they were added to
+# the graph, so the result is deterministic. Each vertex gets the first
+# color its neighbors do not use.
+#
+# Vertices for which is_fixed holds are not colored; a fixed vertex that
+# is one of the colors (such as a register) is precolored with itself.
+#
+# When no color is left for a vertex, it is spilled, i.e. missing from
+# the result. With spill_cost given, the vertex may instead take the
+# color of a cheaper neighbor that is the only one with that color, and
+# the neighbor is spilled. Vertices without a cost are never evicted.
+#
+# With a graph of moves given, a vertex prefers the color of a vertex it
+# is moved to or from, so that the move can be deleted, and otherwise a
+# color its uncolored move partners can still take.
+#
+# prefer maps vertices to a set of colors they take whenever one of them
+# is free, ahead of move partners' colors.
+def saturation_coloring(G, colors: list, is_fixed=lambda v: False,
+                        spill_cost: dict = None, moves=None,
+                        prefer: dict = None) -> dict:
+    F = G.freeze() if not isinstance(G, CSRGraph) else G
+    n = F.num_vertices()
+    k = len(colors)
+    color_index = {c: i for (i, c) in enumerate(colors)}
+    degree = [F.offsets[i + 1] - F.offsets[i] for i in range(n)]
+    color = [None] * n
+    done = [False] * n
+    fixed = [False] * n
+    # the number of neighbors with each color
+    taken = [{} for _ in range(n)]
+    inf = float('inf')
+    cost = [inf] * n
+    if spill_cost is not None:
+        for (i, v) in enumerate(F.names):
+            cost[i] = spill_cost.get(v, inf)
+    partners = [()] * n
+    if moves is not None:
+        for (i, v) in enumerate(F.names):
+            if v in moves.vertices():
+                partners[i] = [F.ids[w] for w in moves.adjacent(v)
+                               if w in F.ids and w != v]
+    preferred = [()] * n
+    if prefer is not None:
+        for (i, v) in enumerate(F.names):
+            if v in prefer:
+                preferred[i] = set(color_index[c] for c in prefer[v])
+
+    def choose(i):
+        t = taken[i]
+        free = [c for c in range(k) if c not in t]
+        if preferred[i]:
+            free = [c for c in free if c in preferred[i]] or free
+        if not free or not partners[i]:
+            return free[0] if free else None
+        for j in partners[i]:
+            if color[j] is not None and color[j] in free:
+                return color[j]
+        for c in free:
+            if all(c not in taken[j] for j in partners[i] if not done[j]):
+                return c
+        return free[0]
+
+    def give(i, c):
+        color[i] = c
+        for j in F.neighbor_ids(i):
+            t = taken[j]
+            if c in t:
+                t[c] += 1
+            else:
+                t[c] = 1
+                if not done[j]:
+                    heappush(heap, (-len(t), -degree[j], j))
+
+    def take_back(i):
+        c = color[i]
+        color[i] = None
+        for j in F.neighbor_ids(i):
+            t = taken[j]
+            t[c] -= 1
+            if t[c] == 0:
+                del t[c]
+                if not done[j]:
+                    heappush(heap, (-len(t), -degree[j], j))
+
+    heap = []
+    todo = []
+    for (i, v) in enumerate(F.names):
+        if is_fixed(v):
+            done[i] = fixed[i] = True
+            c = color_index.get(v)
+            if c is not None:
+                give(i, c)
+        else:
+            todo.append(i)
+
+    # entries go stale when a vertex's saturation grows; those are
+    # recognized by their saturation and skipped
+    heap += [(-len(taken[i]), -degree[i], i) for i in todo]
+    heapify(heap)
+    while heap:
+        (neg_saturation, _, i) = heappop(heap)
+        if done[i] or -neg_saturation != len(taken[i]):
+            continue
+        done[i] = True
+        c = choose(i)
+        if c is None:
+            cheapest = None
+            for j in F.neighbor_ids(i):
+                if color[j] is not None and not fixed[j] \
+                   and taken[i][color[j]] == 1 \
+                   and cost[j] < (cost[i] if cheapest is None else cost[cheapest]):
+                    cheapest = j
+            if cheapest is None:
+                continue
+            c = color[cheapest]
+            take_back(cheapest)
+        give(i, c)
+
+    return {F.names[i]: colors[color[i]] for i in todo if color[i] is not None}
+
+# The number of natural loops each vertex of a control-flow graph is
+# nested in. A loop is formed by a back edge u -> h whose target h
+# dominates u; loops with the same header are merged. Vertices not
+# reachable from entry have depth 0.
+def loop_depths(G: DirectedAdjList, entry) -> dict:
+    preds = {u: [] for u in G.vertices()}
+    for u in G.vertices():
+        for v in G.adjacent(u):
+            preds[v].append(u)
+
+    # reverse postorder from entry
+    order = []
+    visited = set([entry])
+    stack = [(entry, iter(G.adjacent(entry)))]
+    while stack:
+        (u, children) = stack[-1]
+        for v in children:
+            if v not in visited:
+                visited.add(v)
+                stack.append((v, iter(G.adjacent(v))))
+                break
+        else:
+            stack.pop()
+            order.append(u)
+    order.reverse()
+
+    dominators = {u: set(order) for u in order}
+    dominators[entry] = set([entry])
+    changed = True
+    while changed:
+        changed = False
+        for u in order[1:]:
+            new = set.intersection(*[dominators[p] for p in preds[u]
+                                     if p in visited]) | set([u])
+            if new != dominators[u]:
+                dominators[u] = new
+                changed = True
+
+    loops = {}
+    for u in order:
+        for h in G.adjacent(u):
+            if h in dominators[u]:
+                body = loops.setdefault(h, set([h]))
+                work = [u]
+                while work:
+                    b = work.pop()
+                    if b not in body:
+                        body.add(b)
+                        work += [p for p in preds[b] if p in visited]
+
+    depth = {u: 0 for u in G.vertices()}
+    for body in loops.values():
+        for b in body:
+            depth[b] += 1
+    return depth
+
 def transpose(G: DirectedAdjList) -> DirectedAdjList:
     G_t = DirectedAdjList()
     for v in G.vertices():
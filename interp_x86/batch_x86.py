@@ -0,0 +1,135 @@
+# Run one x86 program against many inputs. The program is decoded (and
+# in fast mode compiled) once; every input then gets a fresh emulator
+# with stdin redirected to it, either one after another or spread over a
+# pool of worker processes.
+#
+# Usage: python -m interp_x86.batch_x86 [-j N] [--slow] <program> <input>...
+# where <program> is a source file, compiled with compiler_tup, or an
+# assembly file ending in .s.
+
+import io
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from x86_ast import X86Program
+
+from .decode_x86 import DecodedProgram, decode_program, decode_x86_program
+from .eval_x86 import X86Emulator
+from .parser_x86 import x86_parser
+
+
+def decode(program) -> DecodedProgram:
+    match program:
+        case DecodedProgram():
+            return program
+        case X86Program():
+            return decode_x86_program(program)
+        case str():
+            return decode_program(x86_parser.parse(program))
+        case _:
+            raise Exception('decode: unhandled program ' + repr(program))
+
+
+def run_one(program: DecodedProgram, text: str, fast=True, strict=True):
+    emu = X86Emulator(logging=False, strict=strict, fast=fast)
+    stdin = sys.stdin
+    sys.stdin = io.StringIO(text)
+    try:
+        return emu.run_program(program)
+    finally:
+        sys.stdin = stdin
+
+
+def run_or_capture(program, text, fast, strict, errors):
+    try:
+        return run_one(program, text, fast, strict)
+    except Exception as e:
+        if errors == 'return':
+            return e
+        raise
+
+
+# the program of a pool worker, set once by init_worker
+worker_program = None
+
+def init_worker(program: DecodedProgram):
+    global worker_program
+    worker_program = program
+
+def run_in_worker(args):
+    return run_or_capture(worker_program, *args)
+
+
+def run_batch(program, inputs: list[str], processes=None, fast=True,
+              strict=True, errors='raise') -> list:
+    """Run `program` (an X86Program, a DecodedProgram or assembly text)
+    once per input text and return the list of outputs of each run.
+
+    With `processes` set the runs are spread over that many worker
+    processes. With errors='return' a run that raises contributes its
+    exception to the results instead of stopping the batch."""
+    program = decode(program)
+    if processes is None or processes <= 1:
+        return [run_or_capture(program, text, fast, strict, errors)
+                for text in inputs]
+
+    # the compiled units are plain functions and cannot be sent to the
+    # workers; each worker compiles the program on its first run
+    shipped = DecodedProgram(program.labels, program.index,
+                             program.code, program.source)
+    with ProcessPoolExecutor(processes, initializer=init_worker,
+                             initargs=(shipped,)) as pool:
+        return list(pool.map(run_in_worker,
+                             [(text, fast, strict, errors) for text in inputs],
+                             chunksize=max(1, len(inputs) // (4 * processes))))
+
+
+def run_batch_files(program, input_files: list[str], **kwargs) -> list:
+    inputs = []
+    for name in input_files:
+        with open(name) as f:
+            inputs.append(f.read())
+    return run_batch(program, inputs, **kwargs)
+
+
+def main(argv):
+    processes = None
+    fast = True
+    while argv and argv[0].startswith('-'):
+        match argv[0]:
+            case '-j':
+                processes = int(argv[1])
+                argv = argv[2:]
+            case '--slow':
+                fast = False
+                argv = argv[1:]
+            case flag:
+                raise Exception('batch_x86: unknown option ' + flag)
+    if len(argv) < 2:
+        print('Usage: python -m interp_x86.batch_x86 [-j N] [--slow] '
+              '<program> <input>...')
+        return 1
+
+    program_file, *input_files = argv
+    with open(program_file) as f:
+        text = f.read()
+    if program_file.endswith('.s'):
+        program = text
+    else:
+        import compiler_tup
+        program = compiler_tup.Compiler().compile(text)
+
+    results = run_batch_files(program, input_files, processes=processes,
+                              fast=fast, errors='return')
+    failures = 0
+    for (name, result) in zip(input_files, results):
+        if isinstance(result, Exception):
+            failures += 1
+            print(f'{name}: error: {result!r}')
+        else:
+            print(f'{name}: {" ".join(str(v) for v in result)}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,260 @@
+# Translate a decoded x86 program into Python functions, one per code
+# unit. A unit is a basic block, or the tail of a block following a
+# call. Registers and EFLAGS become local variables of the generated
+# function; they are loaded from the register file on entry and written
+# back before control leaves the unit. Each unit returns the index of
+# the next unit to run, and a trampoline in CompiledProgram.run drives
+# the program from one unit to the next.
+
+from utils import mask_64, offset_64
+
+from .decode_x86 import *
+from .eval_x86 import FunPointer, ReturnAddress
+
+# unit results other than the index of the next unit
+RET = -1
+
+# placeholder for the code that writes registers back before a unit exits
+EXIT_MARK = object()
+
+
+def call_result(unit: int) -> int:
+    return -2 - unit
+
+
+def wrap(e: str) -> str:
+    # inline version of utils.to_signed, to avoid a call per operation
+    return f'((({e}) + {offset_64}) & {mask_64}) - {offset_64}'
+
+
+class UnitCompiler:
+    def __init__(self, program: DecodedProgram, block_unit):
+        self.program = program
+        self.block_unit = block_unit
+
+    def reg(self, r: int) -> str:
+        self.used.add(r)
+        return REGISTERS[r]
+
+    def set_reg(self, r: int) -> str:
+        self.used.add(r)
+        self.written.add(r)
+        return REGISTERS[r]
+
+    def read(self, a) -> str:
+        kind = a[0]
+        if kind == REG:
+            return self.reg(a[1])
+        elif kind == IMM:
+            return repr(a[1])
+        elif kind == MEM:
+            return f'load({self.reg(a[1])} + {a[2]})'
+        elif kind == VAR:
+            return f'V[{a[1]!r}]'
+        elif kind == GLOBAL:
+            return f'G[{a[1]!r}]'
+        else:
+            raise RuntimeError(f'Unknown arg in read: {a}')
+
+    def write(self, a, e: str) -> str:
+        kind = a[0]
+        if kind == REG:
+            return f'{self.set_reg(a[1])} = {e}'
+        elif kind == MEM:
+            return f'store({self.reg(a[1])} + {a[2]}, {e})'
+        elif kind == VAR:
+            return f'V[{a[1]!r}] = {e}'
+        elif kind == GLOBAL:
+            return f'G[{a[1]!r}] = {e}'
+        else:
+            raise RuntimeError(f'Unknown arg in write: {a}')
+
+    def target(self, block: int) -> str:
+        return repr(RET if block == EXIT else self.block_unit[block])
+
+    def push_return(self, label, offset) -> list[str]:
+        rsp = self.set_reg(RSP)
+        return [f'{rsp} = {rsp} - 8',
+                f'store({rsp}, ReturnAddress({label!r}, {offset}))']
+
+    # Returns the statements for one instruction. EXIT_MARK stands for
+    # the write-back code, which is only known once the whole unit has
+    # been translated.
+    def instr(self, op, block: int, pc: int) -> list[str]:
+        opc = op[0]
+        if opc == MOVQ or opc == MOVZBQ:
+            return [self.write(op[2], self.read(op[1]))]
+        elif opc == ADDQ:
+            return [self.write(op[2],
+                               wrap(f'{self.read(op[2])} + {self.read(op[1])}'))]
+        elif opc == SUBQ:
+            return [self.write(op[2],
+                               wrap(f'{self.read(op[2])} - {self.read(op[1])}'))]
+        elif opc == CMPQ:
+            self.flags_written = True
+            return [f'v1 = {self.read(op[1])}',
+                    f'v2 = {self.read(op[2])}',
+                    "flags = 'e' if v1 == v2 else 'l' if v2 < v1 else 'g'"]
+        elif opc == JCC:
+            self.flags_read = True
+            return [f'if flags in {op[1]!r}:',
+                    EXIT_MARK,
+                    f'    return {self.target(op[2])}']
+        elif opc == JMP:
+            return [EXIT_MARK, f'return {self.target(op[1])}']
+        elif opc == SETCC:
+            self.flags_read = True
+            return [self.write(op[2], f'1 if flags in {op[1]!r} else 0')]
+        elif opc == XORQ and op[1] == op[2] and op[1][0] == REG:
+            # xorq r, r zeroes r whatever it held, even nothing yet
+            return [self.write(op[2], '0')]
+        elif opc == XORQ:
+            return [self.write(op[2],
+                               f'{self.read(op[2])} ^ {self.read(op[1])}')]
+        elif opc == ANDQ:
+            return [self.write(op[2],
+                               f'{self.read(op[2])} & {self.read(op[1])}')]
+        elif opc == SARQ:
+            return [self.write(op[2],
+                               f'{self.read(op[2])} >> {self.read(op[1])}')]
+        elif opc == NEGQ:
+            return [self.write(op[1], wrap(f'-{self.read(op[1])}'))]
+        elif opc == PUSHQ:
+            rsp = self.set_reg(RSP)
+            return [f'{rsp} = {rsp} - 8',
+                    f'store({rsp}, {self.read(op[1])})']
+        elif opc == POPQ:
+            rsp = self.set_reg(RSP)
+            return [f'v = load({rsp})',
+                    f'{rsp} = {rsp} + 8',
+                    self.write(op[1], 'v')]
+        elif opc == LEAQ:
+            return [f'v = {self.read(op[1])}',
+                    'assert isinstance(v, FunPointer)',
+                    self.write(op[2], 'v')]
+        elif opc == PRINT_INT:
+            return [f'output.append({self.reg(RDI)})']
+        elif opc == READ_INT:
+            return [f'{self.set_reg(RAX)} = emu.read_int()']
+        elif opc == INITIALIZE:
+            return [f'emu.initialize({self.reg(RDI)}, {self.reg(RSI)})']
+        elif opc == COLLECT:
+            return [f'emu.collect({self.reg(RDI)}, {self.reg(RSI)})']
+        elif opc == CALLQ:
+            label = self.program.labels[block]
+            return self.push_return(label, pc + 1) + \
+                [EXIT_MARK, f'return {call_result(self.block_unit[op[1]])}']
+        elif opc == INDIRECT_CALLQ:
+            label = self.program.labels[block]
+            return [f'v = {self.read(op[1])}',
+                    'assert isinstance(v, FunPointer)'] + \
+                self.push_return(label, pc + 1) + \
+                [EXIT_MARK, 'return -2 - label_unit[v.fun_name]']
+        elif opc == INDIRECT_JMP:
+            return [f'v = {self.read(op[1])}',
+                    'assert isinstance(v, FunPointer)',
+                    EXIT_MARK, 'return label_unit[v.fun_name]']
+        elif opc == RETQ:
+            return [EXIT_MARK, f'return {RET}']
+        else:
+            raise RuntimeError(f'Unknown opcode: {opc}')
+
+    def unit(self, name: str, block: int, start: int, end: int) -> str:
+        self.used = set()
+        self.written = set()
+        self.flags_read = False
+        self.flags_written = False
+
+        body = []
+        code = self.program.code[block]
+        pc = start
+        while pc < end:
+            op = code[pc]
+            body += self.instr(op, block, pc)
+            pc += 1
+            if op[0] in (JMP, RETQ, INDIRECT_JMP, CALLQ, INDIRECT_CALLQ):
+                break
+        else:
+            # running off the end of a block falls through into the next
+            # one, and off the end of the last block returns like retq
+            follow = block + 1 if block + 1 < len(self.program.code) else EXIT
+            body += [EXIT_MARK, f'return {self.target(follow)}']
+
+        write_back = [f'R[{r}] = {REGISTERS[r]}' for r in sorted(self.written)]
+        if self.flags_written:
+            write_back.append(f'R[{EFLAGS}] = flags')
+
+        lines = [f'def {name}(R):']
+        lines += [f'    {REGISTERS[r]} = R[{r}]' for r in sorted(self.used)]
+        if self.flags_read or self.flags_written:
+            lines.append(f'    flags = R[{EFLAGS}]')
+        indent = '    '
+        for s in body:
+            if s is EXIT_MARK:
+                lines += [indent + w for w in write_back]
+            else:
+                lines.append('    ' + s)
+                indent = '        ' if s.startswith('if ') else '    '
+        return '\n'.join(lines)
+
+
+class CompiledProgram:
+    def __init__(self, program: DecodedProgram):
+        self.program = program
+
+        # units start at the beginning of every block and after every call
+        starts = []
+        for (b, code) in enumerate(program.code):
+            starts.append((b, 0))
+            for (pc, op) in enumerate(code):
+                if op[0] in (CALLQ, INDIRECT_CALLQ):
+                    starts.append((b, pc + 1))
+        self.unit_at = {s: u for (u, s) in enumerate(starts)}
+        self.block_unit = [self.unit_at[(b, 0)]
+                           for b in range(len(program.code))]
+        label_unit = {l: self.block_unit[b]
+                      for (b, l) in enumerate(program.labels)}
+
+        compiler = UnitCompiler(program, self.block_unit)
+        sources = []
+        for (u, (b, start)) in enumerate(starts):
+            if u + 1 < len(starts) and starts[u + 1][0] == b:
+                end = starts[u + 1][1]
+            else:
+                end = len(program.code[b])
+            sources.append(compiler.unit(f'unit_{u}', b, start, end))
+        self.source = '\n\n'.join(sources)
+
+        self.namespace = {
+            'FunPointer': FunPointer,
+            'ReturnAddress': ReturnAddress,
+            'label_unit': label_unit,
+        }
+        exec(compile(self.source, '<x86 units>', 'exec'), self.namespace)
+        self.units = [self.namespace[f'unit_{u}'] for u in range(len(starts))]
+
+    def run(self, emu, block: int, output: list):
+        ns = self.namespace
+        ns['emu'] = emu
+        ns['load'] = emu.memory.load
+        ns['store'] = emu.memory.store
+        ns['G'] = emu.global_vals
+        ns['V'] = emu.variables
+        ns['output'] = output
+
+        units = self.units
+        R = emu.registers
+        u = self.block_unit[block]
+        depth = 0
+        while True:
+            u = units[u](R)
+            if u < 0:
+                if u == RET:
+                    if depth == 0:
+                        return
+                    ra = emu.pop_return()
+                    depth -= 1
+                    u = self.unit_at[(self.program.index[ra.block], ra.offset)]
+                else:
+                    depth += 1
+                    u = -2 - u
@@ -0,0 +1,286 @@
+# Decode x86 programs, either in the parse tree format used by the
+# interpreter or as the x86 AST classes produced by the compiler, into a
+# compact stream of operations. Every instruction becomes a tuple whose
+# first element is an opcode int; operands are pre-resolved so the
+# emulator never has to look at a Tree or an AST node while running.
+
+from dataclasses import dataclass, field
+
+from lark import Tree
+from utils import GlobalValue, is_int64, label_name, neg64
+from x86_ast import *
+import x86_ast
+
+# opcodes
+MOVQ = 0
+ADDQ = 1
+SUBQ = 2
+CMPQ = 3
+JMP = 4
+JCC = 5
+SETCC = 6
+MOVZBQ = 7
+XORQ = 8
+NEGQ = 9
+ANDQ = 10
+SARQ = 11
+PUSHQ = 12
+POPQ = 13
+LEAQ = 14
+CALLQ = 15
+INDIRECT_CALLQ = 16
+INDIRECT_JMP = 17
+RETQ = 18
+PRINT_INT = 19
+READ_INT = 20
+INITIALIZE = 21
+COLLECT = 22
+
+# operand kinds
+REG = 0
+IMM = 1
+MEM = 2
+VAR = 3
+GLOBAL = 4
+
+# jump target meaning "leave the current frame", used for jumps to a
+# conclusion block that is not part of the program yet
+EXIT = -1
+
+REGISTERS = ('rax', 'rbx', 'rcx', 'rdx', 'rsi', 'rdi', 'rbp', 'rsp',
+             'r8', 'r9', 'r10', 'r11', 'r12', 'r13', 'r14', 'r15',
+             'al', 'rip', 'EFLAGS')
+
+REGISTER_INDEX = {r: i for (i, r) in enumerate(REGISTERS)}
+
+RAX = REGISTER_INDEX['rax']
+RSI = REGISTER_INDEX['rsi']
+RDI = REGISTER_INDEX['rdi']
+RBP = REGISTER_INDEX['rbp']
+RSP = REGISTER_INDEX['rsp']
+EFLAGS = REGISTER_INDEX['EFLAGS']
+
+# EFLAGS values for which a conditional jump or set is taken
+jump_conditions = {
+    'je': ('e',),
+    'jne': ('g', 'l'),
+    'jl': ('l',),
+    'jle': ('l', 'e'),
+    'jg': ('g',),
+    'jge': ('g', 'e'),
+}
+
+set_conditions = {
+    'sete': ('e',),
+    'setne': ('g', 'l', None),
+    'setl': ('l',),
+    'setle': ('l', 'e'),
+    'setg': ('g',),
+    'setge': ('g', 'e'),
+}
+
+binary_opcodes = {
+    'movq': MOVQ,
+    'movzbq': MOVZBQ,
+    'addq': ADDQ,
+    'subq': SUBQ,
+    'xorq': XORQ,
+    'andq': ANDQ,
+    'sarq': SARQ,
+    'cmpq': CMPQ,
+    'leaq': LEAQ,
+}
+
+unary_opcodes = {
+    'negq': NEGQ,
+    'pushq': PUSHQ,
+    'popq': POPQ,
+}
+
+runtime_opcodes = {
+    label_name('print_int'): PRINT_INT,
+    label_name('read_int'): READ_INT,
+    'initialize': INITIALIZE,
+    'collect': COLLECT,
+}
+
+
+@dataclass
+class DecodedProgram:
+    labels: list[str] = field(default_factory=list)
+    index: dict[str, int] = field(default_factory=dict)
+    code: list[list[tuple]] = field(default_factory=list)
+    source: list[list] = field(default_factory=list)
+    # the compile_x86.CompiledProgram for this program, built on demand
+    compiled: object = None
+
+    def entry(self):
+        for l in (label_name('main'), label_name('start')):
+            if l in self.index:
+                return self.index[l]
+        return None
+
+
+def decode_imm(e) -> int:
+    match e:
+        case Tree(data='int_a', children=[Tree() as e1]):
+            return decode_imm(e1)
+        case Tree(data='int_a', children=[v]):
+            v = int(v)
+            if is_int64(v):
+                return v
+            else:
+                raise Exception('decode_imm: invalid immediate:', v)
+        case Tree(data='neg_a', children=[e1]):
+            return neg64(decode_imm(e1))
+        case _:
+            raise Exception('decode_imm: unknown immediate:', e)
+
+
+def decode_reg(r) -> int:
+    return REGISTER_INDEX[str(r)]
+
+
+def decode_arg(a) -> tuple:
+    match a.data:
+        case 'reg_a':
+            return (REG, decode_reg(a.children[0]))
+        case 'var_a':
+            return (VAR, str(a.children[0]))
+        case 'int_a' | 'neg_a':
+            return (IMM, decode_imm(a))
+        case 'mem_a':
+            offset, reg = a.children
+            return (MEM, decode_reg(reg), decode_imm(offset))
+        case 'direct_mem_a':
+            return (MEM, decode_reg(a.children[0]), 0)
+        case 'global_val_a':
+            loc, reg = a.children
+            assert str(reg) == 'rip', a
+            return (GLOBAL, str(loc))
+        case _:
+            raise RuntimeError(f'Unknown arg in decode_arg: {a}')
+
+
+def decode_target(target, program: DecodedProgram) -> int:
+    target = str(target)
+    if target in program.index:
+        return program.index[target]
+    elif target == label_name('conclusion'):
+        return EXIT
+    else:
+        raise Exception('jump to invalid target ' + target)
+
+
+def decode_instr(instr, program: DecodedProgram) -> tuple:
+    op = instr.data
+    if op in binary_opcodes:
+        a1, a2 = instr.children
+        return (binary_opcodes[op], decode_arg(a1), decode_arg(a2))
+    elif op in unary_opcodes:
+        return (unary_opcodes[op], decode_arg(instr.children[0]))
+    elif op == 'jmp':
+        return (JMP, decode_target(instr.children[0], program))
+    elif op in jump_conditions:
+        return (JCC, jump_conditions[op],
+                decode_target(instr.children[0], program))
+    elif op in set_conditions:
+        return (SETCC, set_conditions[op], decode_arg(instr.children[0]))
+    elif op == 'callq':
+        return decode_call(str(instr.children[0]), program)
+    elif op == 'indirect_callq':
+        return (INDIRECT_CALLQ, decode_arg(instr.children[0]))
+    elif op == 'indirect_jmp':
+        return (INDIRECT_JMP, decode_arg(instr.children[0]))
+    elif op == 'retq':
+        return (RETQ,)
+    else:
+        raise RuntimeError(f'Unknown instruction: {op}')
+
+
+def decode_call(target: str, program: DecodedProgram) -> tuple:
+    if target in runtime_opcodes:
+        return (runtime_opcodes[target],)
+    elif target in program.index:
+        return (CALLQ, program.index[target])
+    else:
+        raise Exception('call to unknown function ' + target)
+
+
+def decode_ast_imm(v) -> int:
+    if is_int64(v):
+        return v
+    else:
+        raise Exception('decode_ast_imm: invalid immediate:', v)
+
+
+def decode_ast_arg(a: arg) -> tuple:
+    match a:
+        case Reg(id):
+            return (REG, decode_reg(id))
+        case Variable(id):
+            return (VAR, id)
+        case Immediate(value):
+            return (IMM, decode_ast_imm(value))
+        case Deref(reg, offset):
+            return (MEM, decode_reg(reg), decode_ast_imm(offset))
+        case GlobalValue(id) | x86_ast.Global(id):
+            return (GLOBAL, id)
+        case _:
+            raise Exception('decode_ast_arg: unhandled ' + repr(a))
+
+
+def decode_ast_instr(i: instr, program: DecodedProgram) -> tuple:
+    match i:
+        case Instr(op, [a1, a2]) if op in binary_opcodes:
+            return (binary_opcodes[op], decode_ast_arg(a1), decode_ast_arg(a2))
+        case Instr(op, [a]) if op in unary_opcodes:
+            return (unary_opcodes[op], decode_ast_arg(a))
+        case Instr(op, [a]) if op in set_conditions:
+            return (SETCC, set_conditions[op], decode_ast_arg(a))
+        case Instr('retq', []):
+            return (RETQ,)
+        case Callq(func, _):
+            return decode_call(func, program)
+        case IndirectCallq(func, _):
+            return (INDIRECT_CALLQ, decode_ast_arg(func))
+        case Jump(label):
+            return (JMP, decode_target(label, program))
+        case JumpIf(cc, label):
+            return (JCC, jump_conditions['j' + cc],
+                    decode_target(label, program))
+        case IndirectJump(target):
+            return (INDIRECT_JMP, decode_ast_arg(target))
+        case _:
+            raise Exception('decode_ast_instr: unhandled ' + repr(i))
+
+
+def decode_blocks(blocks: list[tuple[str, list]],
+                  decode=decode_instr) -> DecodedProgram:
+    program = DecodedProgram()
+    # number the blocks first so that forward jumps can be resolved
+    for (l, instrs) in blocks:
+        program.index[l] = len(program.labels)
+        program.labels.append(l)
+        program.source.append(instrs)
+    for instrs in program.source:
+        program.code.append([decode(i, program) for i in instrs])
+    return program
+
+
+def decode_program(p) -> DecodedProgram:
+    assert p.data == 'prog'
+    blocks = []
+    for b in p.children:
+        assert b.data == 'block'
+        block_name, *instrs = b.children
+        blocks.append((str(block_name), instrs))
+    return decode_blocks(blocks)
+
+
+def decode_x86_program(p: X86Program) -> DecodedProgram:
+    if isinstance(p.body, list):
+        blocks = [(label_name('main'), p.body)]
+    else:
+        blocks = list(p.body.items())
+    return decode_blocks(blocks, decode_ast_instr)
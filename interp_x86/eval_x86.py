@@ -6,14 +6,21 @@ from dataclasses import dataclass
 
 from utils import *
 
-from .convert_x86 import convert_program
+from .decode_x86 import *
+from .gc_x86 import CopyingCollector
+from .memory_x86 import *
 from .parser_x86 import x86_parser, x86_parser_instrs
+from .profile_x86 import Profile, ProfiledMemory
+from .trace_x86 import Snapshot, Tracer
 
 
+# Runs an X86Program, or the text of an assembly program.
 def interp_x86(program):
-    x86_program = convert_program(program)
-    emu = X86Emulator(logging=False)
-    x86_output = emu.eval_program(x86_program)
+    emu = X86Emulator(logging=False, strict=True)
+    if isinstance(program, str):
+        x86_output = emu.parse_and_eval_program(program)
+    else:
+        x86_output = emu.eval_x86_program(program)
     for s in x86_output:
         print(s, end='')
 
@@ -21,16 +28,42 @@ def interp_x86(program):
 class FunPointer:
     fun_name: str
 
+@dataclass
+class ReturnAddress:
+    block: str
+    offset: int
+
 class X86Emulator:
-    def __init__(self, logging=True):
-        self.registers = defaultdict(lambda: None)
-        self.memory = defaultdict(lambda: None)
+    def __init__(self, logging=True, strict=False, fast=False, tracer=None,
+                 profile=False):
+        # registers are indexed by their number in decode_x86.REGISTERS;
+        # None marks a register that was never written
+        self.registers = [None] * len(REGISTERS)
+        # with profile set, self.profile counts executed instructions and
+        # memory traffic, see profile_x86; profiled programs are always
+        # interpreted, even in fast mode
+        self.profile = Profile() if profile else None
+        if self.profile is None:
+            self.memory = Memory(strict)
+        else:
+            self.memory = ProfiledMemory(strict, self.profile)
         self.variables = defaultdict(lambda: None)
         self.logging = logging
-        self.registers['rbp'] = 1000
-        self.registers['rsp'] = 1000
+        # in fast mode each block is compiled to a Python function, see
+        # compile_x86; logging has no effect on the compiled code
+        self.fast = fast
+        # a trace_x86.Tracer recording executed instructions; logging
+        # echoes every instruction through a tracer. Traced programs are
+        # also always interpreted.
+        if tracer is None and logging:
+            tracer = Tracer(echo=True)
+        self.tracer = tracer
+        self.registers[RBP] = STACK_BEGIN
+        self.registers[RSP] = STACK_BEGIN
 
         self.global_vals = {}
+        # the garbage collector, created by the runtime's initialize
+        self.gc = None
 
     def log(self, s):
         if self.logging:
@@ -41,32 +74,33 @@ class X86Emulator:
         return self.eval_program(p)
 
     def eval_program(self, p):
-        assert p.data == 'prog'
-        blocks = {}
+        return self.run_program(decode_program(p))
+
+    def eval_x86_program(self, p: X86Program):
+        return self.run_program(decode_x86_program(p))
+
+    def run_program(self, program: DecodedProgram):
         output = []
 
-        # transform the program into a dict of blocks
-        for b in p.children:
-            assert b.data == 'block'
-            block_name, *instrs = b.children
-            name = str(block_name)
-            blocks[name] = instrs
+        for name in program.labels:
             self.global_vals[name] = FunPointer(name)
 
         self.log('========== STARTING EXECUTION ==============================')
 
         # start evaluating at "main" or at "start"
-        if label_name('main') in blocks.keys():
-            self.eval_instrs(blocks[label_name('main')], blocks,
-                             output)
-        elif label_name('start') in blocks.keys():
-            self.eval_instrs(blocks[label_name('start')], blocks,
-                             output)
-
+        entry = program.entry()
+        if entry is not None and self.fast and self.tracer is None \
+           and self.profile is None:
+            from .compile_x86 import CompiledProgram
+            if program.compiled is None:
+                program.compiled = CompiledProgram(program)
+            program.compiled.run(self, entry, output)
+        elif entry is not None:
+            self.eval_instrs(program, entry, output)
 
         self.log('FINAL STATE:')
         if self.logging:
-            print(self.print_state())
+            print(self.snapshot())
 
         self.log(f'OUTPUT: {output}')
         self.log('========== FINISHED EXECUTION ==============================')
@@ -79,11 +113,11 @@ class X86Emulator:
         p = x86_parser_instrs.parse(s)
 
         assert p.data == 'instrs'
-        blocks = {}
+        program = decode_blocks([(None, p.children)])
         output = []
 
         orig_memory = self.memory.copy()
-        orig_registers = self.registers.copy()
+        orig_registers = self.register_dict()
         orig_variables = self.variables.copy()
 
 
@@ -94,20 +128,21 @@ class X86Emulator:
         self.log('========== STARTING EXECUTION ==============================')
 
         # start evaluating at "main"
-        self.eval_instrs(p.children, blocks, output)
-
+        self.eval_instrs(program, 0, output)
         self.log('FINAL STATE:')
         if self.logging:
-            print(self.print_state())
+            print(self.snapshot())
 
         self.log(f'OUTPUT: {output}')
         self.log('========== FINISHED EXECUTION ==============================')
 
-        changes_memory = [[ f'mem {k}', orig_memory[k], self.memory[k] ] \
-                          for k in self.diff_dicts(self.memory, orig_memory) ]
-        changes_registers = [[ f'reg {k}',orig_registers[k],self.registers[k] ]\
+        memory = self.memory.copy()
+        registers = self.register_dict()
+        changes_memory = [[ f'mem {k}', orig_memory.get(k), memory[k] ] \
+                          for k in self.diff_dicts(memory, orig_memory) ]
+        changes_registers = [[ f'reg {k}',orig_registers.get(k),registers[k] ]\
                              for k in \
-                             self.diff_dicts(self.registers, orig_registers) ]
+                             self.diff_dicts(registers, orig_registers) ]
         changes_variables =[[ f'var {k}',orig_variables[k],self.variables[k] ] \
                              for k in \
                              self.diff_dicts(self.variables, orig_variables) ]
@@ -122,303 +157,268 @@ class X86Emulator:
     def diff_dicts(self, d_after, d_orig):
         keys_diff = []
         for k in d_after.keys():
-            if d_orig[k] != d_after[k]:
+            if d_orig.get(k) != d_after[k]:
                 keys_diff.append(k)
         return keys_diff
 
-    def print_state(self):
-        import pandas as pd
-
-        pd.set_option("display.max_rows", None)
-        memory = [[ f'mem {k}', self.memory[k] ] \
-                  for k in sorted(self.memory.keys()) ]
-        registers = [[ f'reg {k}', self.registers[k] ] \
-                     for k in self.registers.keys() ]
-        variables = [[ f'var {k}', self.variables[k] ] \
-                     for k in self.variables.keys() ]
-        gvals = [[ f'{k}', self.global_vals[k] ] \
-                 for k in self.global_vals.keys() ]
-
-        all_state = memory + registers + variables + gvals
+    def snapshot(self) -> Snapshot:
+        return Snapshot(self.register_dict(), self.memory.copy(),
+                        dict(self.variables), dict(self.global_vals))
 
-        state_df = pd.DataFrame(all_state, columns=['Location', 'Value'])
+    def print_state(self):
+        return self.snapshot().to_dataframe()
 
-        return state_df
+    def register_dict(self):
+        return {r: v for (r, v) in zip(REGISTERS, self.registers)
+                if v is not None}
 
     def print_mem(self, mem):
         for k, v in mem.items():
             self.log(f' {k}:\t {v}')
 
-    def eval_imm(self, e) -> int:
-        if e.data == 'int_a':
-           ### fix ###
-           from lark import Tree
-           if type(e.children[0]) == Tree:
-              v = int(e.children[0].children[0])
-           else:
-           ### fix ###
-
-              v = int(e.children[0])
-           if is_int64(v):
-               return v
-           else:
-               raise Exception('eval_imm: invalid immediate:', v)
-
-        #if e.data == 'int_a':
-        #    return int(e.children[0])
-        #elif e.data == 'neg_a':
-        if e.data == 'neg_a':
-            return -self.eval_imm(e.children[0])
-        else:
-            raise Exception('eval_imm: unknown immediate:', e)
-
-    def eval_arg(self, a):
-        if a.data == 'reg_a':
-            return self.registers[str(a.children[0])]
-        elif a.data == 'var_a':
-            return self.variables[str(a.children[0])]
-        # elif a.data == 'int_a' or a.data == 'neg_a':
-        #     return self.eval_imm(a)
-        elif a.data == 'int_a':
-            return self.eval_imm(a)
-        elif a.data == 'neg_a':
-            return neg64(self.eval_imm(a.children[0]))
-        elif a.data == 'mem_a':
-            offset, reg = a.children
-            addr = self.registers[reg]
-            offset_addr = add64(addr,self.eval_imm(offset))
-            # offset_addr = addr + self.eval_imm(offset)
-            return self.memory[offset_addr]
-        elif a.data == 'global_val_a':
-            loc, reg = a.children
-            assert str(reg) == 'rip', a
-            return self.global_vals[str(loc)]
+    def load_arg(self, a):
+        kind = a[0]
+        if kind == REG:
+            return self.registers[a[1]]
+        elif kind == IMM:
+            return a[1]
+        elif kind == MEM:
+            return self.memory.load(add64(self.registers[a[1]], a[2]))
+        elif kind == VAR:
+            return self.variables[a[1]]
+        elif kind == GLOBAL:
+            return self.global_vals[a[1]]
         else:
-            raise RuntimeError(f'Unknown arg in eval_arg: {a}')
+            raise RuntimeError(f'Unknown arg in load_arg: {a}')
 
     def store_arg(self, a, v):
-        if a.data == 'reg_a':
-            self.registers[str(a.children[0])] = v
-        elif a.data == 'var_a':
-            self.variables[str(a.children[0])] = v
-        elif a.data == 'mem_a':
-            offset, reg = a.children
-            addr = self.registers[reg]
-            #offset_addr = addr + self.eval_imm(offset)
-            offset_addr = add64(addr,self.eval_imm(offset))
-            self.memory[offset_addr] = v
-        elif a.data == 'direct_mem_a':
-            reg = a.children[0]
-            addr = self.registers[reg]
-            self.memory[addr] = v
-        elif a.data == 'global_val_a':
-            loc, reg = a.children
-            assert str(reg) == 'rip', a
-            self.global_vals[str(loc)] = v
-
+        kind = a[0]
+        if kind == REG:
+            self.registers[a[1]] = v
+        elif kind == MEM:
+            self.memory.store(add64(self.registers[a[1]], a[2]), v)
+        elif kind == VAR:
+            self.variables[a[1]] = v
+        elif kind == GLOBAL:
+            self.global_vals[a[1]] = v
         else:
             raise RuntimeError(f'Unknown arg in store_arg: {a}')
 
-    def eval_instrs(self, instrs, blocks, output):
-        for instr in instrs:
-            self.log(f'Evaluating instruction: {instr.pretty()}')
-            if instr.data == 'pushq':
-                a = instr.children[0]
-                self.registers['rsp'] = self.registers['rsp'] - 8
-                v = self.eval_arg(a)
-                self.memory[self.registers['rsp']] = v
-
-            elif instr.data == 'popq':
-                a = instr.children[0]
-                v = self.memory[self.registers['rsp']]
-                self.registers['rsp'] = self.registers['rsp'] + 8
-                self.store_arg(a, v)
-
-            elif instr.data == 'movq':
-                a1, a2 = instr.children
-                v = self.eval_arg(a1)
-                self.store_arg(a2, v)
-
-            elif instr.data == 'movzbq':
-                a1, a2 = instr.children
-                v = self.eval_arg(a1)
-                self.store_arg(a2, v)
-
-            elif instr.data == 'addq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, add64(v1, v2))
-
-            elif instr.data == 'subq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, sub64(v2, v1))
-
-            elif instr.data == 'xorq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
-                self.store_arg(a2, xor64(v1, v2))
-
-            elif instr.data == 'negq':
-                a1 = instr.children[0]
-                v1 = self.eval_arg(a1)
-                self.store_arg(a1, neg64(v1))
-
-            elif instr.data in ['jmp', 'je', 'jne', 'jl', 'jle', 'jg', 'jge']:
-                target = str(instr.children[0])
-                perform_jump = False
-
-                if instr.data == 'jmp':
-                    perform_jump = True
-                elif instr.data == 'je' and self.registers['EFLAGS'] == 'e':
-                    perform_jump = True
-                elif instr.data == 'jne' \
-                     and self.registers['EFLAGS'] in ['g','l']:
-                    perform_jump = True
-                elif instr.data == 'jl' and self.registers['EFLAGS'] == 'l':
-                    perform_jump = True
-                elif instr.data == 'jle' \
-                     and self.registers['EFLAGS'] in ['l', 'e']:
-                    perform_jump = True
-                elif instr.data == 'jg' and self.registers['EFLAGS'] == 'g':
-                    perform_jump = True
-                elif instr.data == 'jge' \
-                     and self.registers['EFLAGS'] in ['g', 'e']:
-                    perform_jump = True
-
-                if perform_jump:
-                    if target in blocks.keys():
-                        self.eval_instrs(blocks[target], blocks, output)
-                    elif target == label_name('conclusion'):
-                        return
-                    else:
-                        raise Exception('jump to invalid target ' + target)
-                    return # after jumping, toss continuation
-
-            elif instr.data in ['sete', 'setne', 'setl', 'setle', 'setg', 'setge']:
-                a1 = instr.children[0]
-
-                if instr.data == 'sete' and self.registers['EFLAGS'] == 'e':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setne' and self.registers['EFLAGS'] != 'e':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setl' and self.registers['EFLAGS'] == 'l':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setle' \
-                     and self.registers['EFLAGS'] in ['l', 'e']:
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setg' and self.registers['EFLAGS'] == 'g':
-                    self.store_arg(a1, 1)
-                elif instr.data == 'setge' \
-                     and self.registers['EFLAGS'] in ['g', 'e']:
-                    self.store_arg(a1, 1)
-                else:
-                    self.store_arg(a1, 0)
-
+    def read_int(self):
+        v = input_int()
+        self.log(f'CALL TO read_int: {v}')
+        return v
+
+    def initialize(self, rootstack_size, heap_size):
+        self.log(f'CALL TO initialize: {rootstack_size}, {heap_size}')
+
+        rs_begin = ROOTSTACK_BEGIN
+        rs_end = rs_begin + rootstack_size
+
+        fromspace_begin = FROMSPACE_BEGIN
+        fromspace_end = fromspace_begin + heap_size
+
+        self.memory.initialize(rootstack_size, heap_size)
+
+        self.global_vals.update({
+            'rootstack_begin': rs_begin,
+            'rootstack_end': rs_end,
+            'free_ptr': fromspace_begin,
+            'fromspace_begin': fromspace_begin,
+            'fromspace_end': fromspace_end
+        })
+        self.gc = CopyingCollector(self.memory, self.global_vals)
+        self.gc.initialize(heap_size)
+
+    def collect(self, rootstack_ptr, needed):
+        self.log(f'CALL TO collect: need {needed} bytes')
+        if self.profile is not None:
+            self.profile.collects += 1
+        if self.gc is None:
+            raise RuntimeError('collect: called before initialize')
+
+        if self.profile is None:
+            self.gc.collect(rootstack_ptr, needed)
+        else:
+            self.profile.collecting = True
+            try:
+                self.gc.collect(rootstack_ptr, needed)
+            finally:
+                self.profile.collecting = False
+        self.log(f'GC: {self.gc.stats}')
+
+    def gc_stats(self):
+        return dict(self.gc.stats) if self.gc is not None else None
+
+    def push_return(self, label, offset):
+        self.registers[RSP] = self.registers[RSP] - 8
+        self.memory.store(self.registers[RSP], ReturnAddress(label, offset))
+
+    def pop_return(self):
+        ra = self.memory.load(self.registers[RSP])
+        if not isinstance(ra, ReturnAddress):
+            raise RuntimeError(f'retq: no return address on top of stack: {ra}')
+        self.registers[RSP] = self.registers[RSP] + 8
+        return ra
+
+    def eval_instrs(self, program, block, output):
+        # The program counter is a block index together with an offset
+        # into the decoded code of that block. Jumps replace the block,
+        # calls push a ReturnAddress onto the emulated stack, so the
+        # Python stack depth stays constant no matter how many jumps the
+        # program makes.
+        registers = self.registers
+        memory = self.memory
+        load = self.load_arg
+        store = self.store_arg
+        tracer = self.tracer
+        counts = None
+        if self.profile is not None:
+            counts = self.profile.counts_for(program)
+
+        code = program.code[block]
+        pc = 0
+        depth = 0
+
+        while True:
+            if pc < len(code):
+                op = code[pc]
+                if counts is not None:
+                    counts[block][pc] += 1
+                if tracer is not None and pc == 0:
+                    tracer.enter_block(self, program, block)
+                # the tracer records an instruction after it ran, so
+                # remember where it came from
+                at_block = block
+                at_pc = pc
+                pc += 1
+                opc = op[0]
+            elif block != EXIT and block + 1 < len(program.code):
+                # running off the end of a block falls through into the
+                # next one, as in the assembled program
+                block += 1
+                code = program.code[block]
+                pc = 0
+                continue
+            else:
+                # running off the end of the last block returns like retq
+                opc = RETQ
+                op = None
 
-            elif instr.data == 'callq':
-                target = str(instr.children[0])
-                if target == label_name('print_int'):
-                    self.log(f'CALL TO print_int: {self.registers["rdi"]}')
-                    output.append(self.registers['rdi'])
-                    if self.logging:
-                        print(self.print_state())
+            if opc == MOVQ or opc == MOVZBQ:
+                store(op[2], load(op[1]))
 
-                elif target == label_name('read_int'):
-                    self.registers['rax'] = input_int()
-                    self.log(f'CALL TO read_int: {self.registers["rax"]}')
-                    if self.logging:
-                        print(self.print_state())
+            elif opc == ADDQ:
+                store(op[2], add64(load(op[1]), load(op[2])))
 
-                elif target == 'initialize':
-                    self.log(f'CALL TO initialize: {self.registers["rdi"]}, {self.registers["rsi"]}')
-                    rootstack_size = self.registers['rdi']
-                    heap_size = self.registers['rsi']
+            elif opc == SUBQ:
+                store(op[2], sub64(load(op[2]), load(op[1])))
 
-                    rs_begin = 2000
-                    rs_end = rs_begin + rootstack_size
+            elif opc == CMPQ:
+                v1 = load(op[1])
+                v2 = load(op[2])
 
-                    fromspace_begin = 100000
-                    fromspace_end = fromspace_begin + heap_size
+                if v1 == v2:
+                    registers[EFLAGS] = 'e'
+                elif v2 < v1:
+                    registers[EFLAGS] = 'l'
+                elif v2 > v1:
+                    registers[EFLAGS] = 'g'
+                else:
+                    raise RuntimeError(f'failed comparison: {op}')
 
-                    self.global_vals = { **self.global_vals,
-                        'rootstack_begin': rs_begin,
-                        'rootstack_end': rs_end,
-                        'free_ptr': fromspace_begin,
-                        'fromspace_begin': fromspace_begin,
-                        'fromspace_end': fromspace_end
-                    }
+            elif opc == JCC:
+                if registers[EFLAGS] in op[1]:
+                    block = op[2]
+                    code = program.code[block] if block != EXIT else ()
+                    pc = 0
 
-                    if self.logging:
-                        print(self.print_state())
+            elif opc == JMP:
+                block = op[1]
+                # leaving through the conclusion ends the frame
+                code = program.code[block] if block != EXIT else ()
+                pc = 0
 
+            elif opc == SETCC:
+                store(op[2], 1 if registers[EFLAGS] in op[1] else 0)
 
-                elif target == 'collect':
-                    self.log(f'CALL TO collect: need {self.registers["rsi"]} bytes')
+            elif opc == XORQ and op[1] == op[2] and op[1][0] == REG:
+                # xorq r, r zeroes r whatever it held, even nothing yet
+                store(op[2], 0)
 
-                    needed = self.registers["rsi"]
-                    fsb = self.global_vals['fromspace_begin']
-                    fse = self.global_vals['fromspace_end']
+            elif opc == XORQ:
+                store(op[2], xor64(load(op[1]), load(op[2])))
 
-                    current_space = fse - fsb
+            elif opc == ANDQ:
+                store(op[2], load(op[1]) & load(op[2]))
 
-                    new_space = current_space
-                    while new_space - current_space < needed:
-                        new_space = new_space * 2
+            elif opc == SARQ:
+                store(op[2], load(op[2]) >> load(op[1]))
 
-                    new_fse = fsb + new_space
-                    self.global_vals['fromspace_end'] = new_fse
+            elif opc == NEGQ:
+                store(op[1], neg64(load(op[1])))
 
-                    if self.logging:
-                        print(self.print_state())
+            elif opc == PUSHQ:
+                registers[RSP] = registers[RSP] - 8
+                memory.store(registers[RSP], load(op[1]))
 
-                else:
-                    self.eval_instrs(blocks[target], blocks, output)
+            elif opc == POPQ:
+                v = memory.load(registers[RSP])
+                registers[RSP] = registers[RSP] + 8
+                store(op[1], v)
 
-            elif instr.data == 'retq':
-                return
+            elif opc == LEAQ:
+                v1 = load(op[1])
+                assert isinstance(v1, FunPointer)
+                store(op[2], v1)
 
-            elif instr.data == 'cmpq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                v2 = self.eval_arg(a2)
+            elif opc == PRINT_INT:
+                self.log(f'CALL TO print_int: {registers[RDI]}')
+                output.append(registers[RDI])
 
-                if v1 == v2:
-                    self.registers['EFLAGS'] = 'e'
-                elif v2 < v1:
-                    self.registers['EFLAGS'] = 'l'
-                elif v2 > v1:
-                    self.registers['EFLAGS'] = 'g'
-                else:
-                    raise RuntimeError(f'failed comparison: {instr}')
+            elif opc == READ_INT:
+                registers[RAX] = self.read_int()
 
-            elif instr.data == 'leaq':
-                a1, a2 = instr.children
-                v1 = self.eval_arg(a1)
-                assert isinstance(v1, FunPointer)
-                self.store_arg(a2, v1)
+            elif opc == INITIALIZE:
+                self.initialize(registers[RDI], registers[RSI])
 
-            elif instr.data == 'indirect_callq':
-                v = self.eval_arg(instr.children[0])
-                assert isinstance(v, FunPointer)
-                target = v.fun_name
-                self.eval_instrs(blocks[target], blocks, output)
+            elif opc == COLLECT:
+                self.collect(registers[RDI], registers[RSI])
 
-            elif instr.data == 'indirect_jmp':
-                v = self.eval_arg(instr.children[0])
+            elif opc == CALLQ or opc == INDIRECT_CALLQ:
+                if opc == CALLQ:
+                    target = op[1]
+                else:
+                    v = load(op[1])
+                    assert isinstance(v, FunPointer)
+                    target = program.index[v.fun_name]
+                self.push_return(program.labels[block], pc)
+                depth += 1
+                block = target
+                code = program.code[block]
+                pc = 0
+
+            elif opc == INDIRECT_JMP:
+                v = load(op[1])
                 assert isinstance(v, FunPointer)
-                target = v.fun_name
-                self.eval_instrs(blocks[target], blocks, output)
-                return # after jumping, toss continuation
+                block = program.index[v.fun_name]
+                code = program.code[block]
+                pc = 0
+
+            elif opc == RETQ:
+                if depth == 0:
+                    return
+                ra = self.pop_return()
+                depth -= 1
+                block = program.index[ra.block]
+                code = program.code[block]
+                pc = ra.offset
 
             else:
-                raise RuntimeError(f'Unknown instruction: {instr.data}')
+                raise RuntimeError(f'Unknown opcode: {opc}')
 
-            if self.logging:
-                print(self.print_state())
+            if tracer is not None and op is not None:
+                tracer.record(self, program, at_block, at_pc, op)
 
 
 
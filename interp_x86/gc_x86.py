@@ -0,0 +1,151 @@
+# A model of the copying collector in runtime.c, running over the
+# emulated heap. The heap holds two semispaces; collect copies everything
+# reachable from the root stack into tospace with Cheney's algorithm,
+# flips the spaces, and doubles them when the live data plus the request
+# does not fit.
+#
+# Tuple tags follow runtime.c:
+#   bits 7..57: pointer mask, bits 1..6: length, bit 0: not forwarding
+# A live object has bit 0 set. A copied object's tag is replaced by its
+# new address, which is 8-byte aligned and so has bit 0 clear.
+
+from .memory_x86 import FROMSPACE_BEGIN, Memory
+
+TAG_IS_NOT_FORWARD_MASK = 1
+TAG_VEC_LENGTH_MASK = 0b1111110
+TAG_VEC_LENGTH_RSHIFT = 1
+TAG_VEC_PTR_BITFIELD_RSHIFT = 7
+
+
+def is_forwarding(tag: int) -> bool:
+    return tag & TAG_IS_NOT_FORWARD_MASK == 0
+
+
+def get_vector_length(tag: int) -> int:
+    return (tag & TAG_VEC_LENGTH_MASK) >> TAG_VEC_LENGTH_RSHIFT
+
+
+def get_vec_ptr_bitfield(tag: int) -> int:
+    return tag >> TAG_VEC_PTR_BITFIELD_RSHIFT
+
+
+class CopyingCollector:
+    def __init__(self, memory: Memory, global_vals: dict):
+        self.memory = memory
+        self.global_vals = global_vals
+        self.tospace_begin = None
+        self.tospace_end = None
+        self.stats = {
+            'collections': 0,
+            'resizes': 0,
+            'objects_copied': 0,
+            'bytes_copied': 0,
+            'bytes_reclaimed': 0,
+            'heap_bytes': 0,
+            'max_heap_bytes': 0,
+        }
+
+    def initialize(self, heap_size: int):
+        self.place_tospace(heap_size)
+        self.stats['heap_bytes'] = heap_size
+        self.stats['max_heap_bytes'] = max(self.stats['max_heap_bytes'],
+                                           heap_size)
+
+    def place_tospace(self, size: int):
+        # Put tospace below fromspace if it fits there, and right after
+        # it otherwise, so the emulated heap never spans more than about
+        # three semispaces.
+        fsb = self.global_vals['fromspace_begin']
+        fse = self.global_vals['fromspace_end']
+        if fsb - FROMSPACE_BEGIN >= size:
+            self.tospace_begin = FROMSPACE_BEGIN
+        else:
+            self.tospace_begin = fse
+        self.tospace_end = self.tospace_begin + size
+
+    def collect(self, rootstack_ptr: int, bytes_requested: int):
+        rootstack_begin = self.global_vals['rootstack_begin']
+        if not rootstack_begin <= rootstack_ptr < self.global_vals['rootstack_end']:
+            raise RuntimeError(f'collect: root stack pointer {rootstack_ptr} '
+                               'outside the root stack')
+        self.stats['collections'] += 1
+        used = self.global_vals['free_ptr'] - self.global_vals['fromspace_begin']
+
+        self.cheney(rootstack_ptr)
+        live = self.global_vals['free_ptr'] - self.global_vals['fromspace_begin']
+        self.stats['bytes_reclaimed'] += used - live
+
+        fse = self.global_vals['fromspace_end']
+        if fse - self.global_vals['free_ptr'] < bytes_requested:
+            # double the heap until the live data and the request fit,
+            # then copy into a tospace of the new size
+            new_bytes = fse - self.global_vals['fromspace_begin']
+            while new_bytes <= live + bytes_requested:
+                new_bytes *= 2
+            self.stats['resizes'] += 1
+            self.place_tospace(new_bytes)
+            self.cheney(rootstack_ptr)
+            self.place_tospace(new_bytes)
+            self.stats['heap_bytes'] = new_bytes
+            self.stats['max_heap_bytes'] = max(self.stats['max_heap_bytes'],
+                                               new_bytes)
+
+    def cheney(self, rootstack_ptr: int):
+        scan_ptr = self.tospace_begin
+        self.free_ptr = self.tospace_begin
+
+        for root_loc in range(self.global_vals['rootstack_begin'],
+                              rootstack_ptr, 8):
+            self.copy_vector(root_loc)
+
+        while scan_ptr != self.free_ptr:
+            scan_ptr = self.process_vector(scan_ptr)
+
+        # flip the spaces, forgetting everything left in fromspace
+        fsb = self.global_vals['fromspace_begin']
+        fse = self.global_vals['fromspace_end']
+        self.memory.release(fsb, fse)
+        self.global_vals['fromspace_begin'] = self.tospace_begin
+        self.global_vals['fromspace_end'] = self.tospace_end
+        self.global_vals['free_ptr'] = self.free_ptr
+        self.tospace_begin = fsb
+        self.tospace_end = fse
+
+    def process_vector(self, scan_ptr: int) -> int:
+        # copy the objects a tospace object points to; returns the
+        # address of the next object
+        tag = self.memory.load(scan_ptr)
+        length = get_vector_length(tag)
+        is_pointer_bits = get_vec_ptr_bitfield(tag)
+        for i in range(length):
+            if (is_pointer_bits >> i) & 1:
+                self.copy_vector(scan_ptr + 8 * (i + 1))
+        return scan_ptr + 8 * (length + 1)
+
+    def copy_vector(self, vector_ptr_loc: int):
+        old_vector_ptr = self.memory.load(vector_ptr_loc)
+        # roots are zeroed by the prelude and may hold no tuple yet
+        if old_vector_ptr is None or old_vector_ptr == 0:
+            return
+        fsb = self.global_vals['fromspace_begin']
+        fse = self.global_vals['fromspace_end']
+        if not (isinstance(old_vector_ptr, int) and fsb <= old_vector_ptr < fse):
+            raise RuntimeError(f'collect: {old_vector_ptr} at {vector_ptr_loc} '
+                               'does not point into fromspace')
+
+        tag = self.memory.load(old_vector_ptr)
+        if is_forwarding(tag):
+            if not self.tospace_begin <= tag < self.free_ptr:
+                raise RuntimeError(f'collect: tag {tag} of the tuple at '
+                                   f'{old_vector_ptr} has bit 0 clear but is '
+                                   'not a forwarding pointer into tospace')
+            self.memory.store(vector_ptr_loc, tag)
+        else:
+            new_vector_ptr = self.free_ptr
+            length = get_vector_length(tag)
+            self.memory.copy_words(old_vector_ptr, new_vector_ptr, length + 1)
+            self.free_ptr += 8 * (length + 1)
+            self.stats['objects_copied'] += 1
+            self.stats['bytes_copied'] += 8 * (length + 1)
+            self.memory.store(old_vector_ptr, new_vector_ptr)
+            self.memory.store(vector_ptr_loc, new_vector_ptr)
@@ -0,0 +1,164 @@
+# The emulated address space. Memory is split into the three regions
+# the emulator lays out: the stack (below rootstack_begin, growing down
+# from the initial %rsp), the root stack and the heap (fromspace). Each
+# region is a Segment of 8-byte words backed by an array('q'), with a
+# parallel bytearray of tags recording whether a word was ever written.
+
+from array import array
+
+from utils import max_int64, min_int64
+
+STACK_BEGIN = 1000
+ROOTSTACK_BEGIN = 2000
+FROMSPACE_BEGIN = 100000
+
+# word tags
+UNWRITTEN = 0
+WORD = 1
+OBJECT = 2   # a non-integer value such as a FunPointer, kept in `objects`
+
+# segments never grow past this many words; anything further away is a
+# wild address and goes to the overflow dictionary instead
+MAX_SEGMENT_WORDS = 1 << 24
+
+
+class UninitializedRead(Exception):
+    pass
+
+
+class Segment:
+    def __init__(self, name: str, begin: int, words: int):
+        self.name = name
+        self.begin = begin
+        self.words = array('q', bytes(8 * words))
+        self.tags = bytearray(words)
+        self.objects = {}
+
+    def end(self) -> int:
+        return self.begin + 8 * len(self.tags)
+
+    def grow_to(self, addr: int) -> bool:
+        # Make room for addr, at least doubling the segment so that
+        # growth is amortized. Returns False for addresses too far away.
+        size = len(self.tags)
+        if addr >= self.begin:
+            needed = ((addr - self.begin) >> 3) + 1
+            extra = max(needed - size, size)
+            if size + extra > MAX_SEGMENT_WORDS:
+                return False
+            self.words.extend(array('q', bytes(8 * extra)))
+            self.tags.extend(bytes(extra))
+        else:
+            needed = (self.begin - addr) >> 3
+            extra = max(needed, size)
+            if size + extra > MAX_SEGMENT_WORDS:
+                return False
+            self.words = array('q', bytes(8 * extra)) + self.words
+            self.tags = bytearray(extra) + self.tags
+            self.objects = {i + extra: v for (i, v) in self.objects.items()}
+            self.begin -= 8 * extra
+        return True
+
+    def items(self):
+        for i in range(len(self.tags)):
+            tag = self.tags[i]
+            if tag == WORD:
+                yield (self.begin + 8 * i, self.words[i])
+            elif tag == OBJECT:
+                yield (self.begin + 8 * i, self.objects[i])
+
+
+class Memory:
+    def __init__(self, strict=False):
+        # with strict set, reading a word that was never written raises
+        # UninitializedRead instead of returning None
+        self.strict = strict
+        stack_begin = STACK_BEGIN - 8 * 512
+        self.stack = Segment('stack', stack_begin,
+                             (ROOTSTACK_BEGIN - stack_begin) >> 3)
+        self.rootstack = Segment('rootstack', ROOTSTACK_BEGIN, 0)
+        self.heap = Segment('heap', FROMSPACE_BEGIN, 0)
+        # unaligned and wild addresses
+        self.overflow = {}
+
+    def initialize(self, rootstack_size: int, heap_size: int):
+        self.rootstack = Segment('rootstack', ROOTSTACK_BEGIN,
+                                 rootstack_size >> 3)
+        self.heap = Segment('heap', FROMSPACE_BEGIN, heap_size >> 3)
+
+    def segment(self, addr: int) -> Segment:
+        if addr >= FROMSPACE_BEGIN:
+            return self.heap
+        elif addr >= ROOTSTACK_BEGIN:
+            return self.rootstack
+        else:
+            return self.stack
+
+    def load(self, addr: int):
+        if addr & 7 == 0:
+            seg = self.segment(addr)
+            i = (addr - seg.begin) >> 3
+            if 0 <= i < len(seg.tags):
+                tag = seg.tags[i]
+                if tag == WORD:
+                    return seg.words[i]
+                elif tag == OBJECT:
+                    return seg.objects[i]
+        if addr in self.overflow:
+            return self.overflow[addr]
+        return self.uninitialized(addr)
+
+    def uninitialized(self, addr: int):
+        if self.strict:
+            raise UninitializedRead(f'read of uninitialized memory at {addr}')
+        return None
+
+    def store(self, addr: int, v):
+        if addr & 7 == 0:
+            seg = self.segment(addr)
+            i = (addr - seg.begin) >> 3
+            if not 0 <= i < len(seg.tags):
+                if not seg.grow_to(addr):
+                    self.overflow[addr] = v
+                    return
+                i = (addr - seg.begin) >> 3
+            if type(v) is int and min_int64 <= v <= max_int64:
+                seg.words[i] = v
+                seg.tags[i] = WORD
+            else:
+                seg.objects[i] = v
+                seg.tags[i] = OBJECT
+        else:
+            self.overflow[addr] = v
+
+    def copy_words(self, src: int, dst: int, n: int):
+        # move n words without looking at them, so that words that were
+        # never written stay unwritten
+        for k in range(0, 8 * n, 8):
+            seg = self.segment(src + k)
+            i = (src + k - seg.begin) >> 3
+            if 0 <= i < len(seg.tags) and seg.tags[i] != UNWRITTEN:
+                v = seg.words[i] if seg.tags[i] == WORD else seg.objects[i]
+                self.store(dst + k, v)
+            elif src + k in self.overflow:
+                self.store(dst + k, self.overflow[src + k])
+
+    def release(self, begin: int, end: int):
+        # forget the words in [begin, end), e.g. a garbage collected
+        # semispace; reading them afterwards counts as uninitialized
+        seg = self.segment(begin)
+        lo = max((begin - seg.begin) >> 3, 0)
+        hi = min((end - seg.begin) >> 3, len(seg.tags))
+        if lo < hi:
+            seg.tags[lo:hi] = bytes(hi - lo)
+            for i in [i for i in seg.objects if lo <= i < hi]:
+                del seg.objects[i]
+
+    def items(self):
+        yield from self.stack.items()
+        yield from self.rootstack.items()
+        yield from self.heap.items()
+        yield from self.overflow.items()
+
+    def copy(self) -> dict:
+        return dict(self.items())
@@ -0,0 +1,125 @@
+# Native execution of x86 programs. Assembly is linked against a cached
+# build of runtime.c into an executable named after the hash of the
+# assembly and the runtime, so an unchanged program is never assembled
+# twice. Executables run in a thread pool with stdin and stdout passed
+# through pipes.
+
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from sys import platform
+
+RUNTIME_SOURCE = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'runtime.c')
+
+CACHE_DIR = os.environ.get('X86_NATIVE_CACHE',
+                           os.path.join(tempfile.gettempdir(), 'x86_native'))
+
+arch_flags = ['-arch', 'x86_64'] if platform == 'darwin' else []
+
+
+@dataclass
+class NativeResult:
+    returncode: int
+    stdout: str
+    stderr: str
+
+
+class NativeRunner:
+    def __init__(self, workers=None, cache_dir=CACHE_DIR, timeout=None):
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(workers or os.cpu_count())
+        self.lock = threading.Lock()
+        self.runtime = None
+        self.runtime_hash = None
+        # executables being built, so concurrent requests for the same
+        # program wait for one build instead of racing
+        self.building: dict[str, Future] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def gcc(self, args: list[str]):
+        result = subprocess.run(['gcc'] + arch_flags + args,
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            raise Exception('gcc failed: ' + result.stderr)
+
+    def runtime_object(self) -> str:
+        # build runtime.o once per version of runtime.c
+        with self.lock:
+            if self.runtime is None:
+                with open(RUNTIME_SOURCE, 'rb') as f:
+                    self.runtime_hash = hashlib.sha256(f.read()).hexdigest()
+                path = os.path.join(self.cache_dir,
+                                    f'runtime-{self.runtime_hash[:16]}.o')
+                if not os.path.exists(path):
+                    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}'
+                    self.gcc(['-c', RUNTIME_SOURCE, '-o', tmp])
+                    os.replace(tmp, path)
+                self.runtime = path
+            return self.runtime
+
+    def executable(self, asm: str) -> str:
+        runtime = self.runtime_object()
+        key = hashlib.sha256((self.runtime_hash + asm).encode()).hexdigest()
+        exe = os.path.join(self.cache_dir, key[:32])
+        with self.lock:
+            if os.path.exists(exe):
+                return exe
+            pending = self.building.get(key)
+            if pending is None:
+                pending = self.building[key] = Future()
+                owner = True
+            else:
+                owner = False
+        if not owner:
+            return pending.result()
+
+        try:
+            # build under a unique name and rename, so that other
+            # processes sharing the cache never see a partial file
+            tmp = f'{exe}.{os.getpid()}.{threading.get_ident()}'
+            with open(tmp + '.s', 'w') as f:
+                f.write(asm)
+            try:
+                self.gcc([runtime, tmp + '.s', '-o', tmp])
+            finally:
+                os.remove(tmp + '.s')
+            os.replace(tmp, exe)
+            pending.set_result(exe)
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.building[key]
+        return exe
+
+    def run(self, asm: str, stdin: str = '') -> NativeResult:
+        exe = self.executable(asm)
+        result = subprocess.run([exe], input=stdin, capture_output=True,
+                                text=True, timeout=self.timeout)
+        return NativeResult(result.returncode, result.stdout, result.stderr)
+
+    def submit(self, asm: str, stdin: str = '') -> Future:
+        return self.pool.submit(self.run, asm, stdin)
+
+    def run_many(self, jobs: list[tuple[str, str]]) -> list[NativeResult]:
+        futures = [self.submit(asm, stdin) for (asm, stdin) in jobs]
+        return [f.result() for f in futures]
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+runner = None
+
+def native_runner() -> NativeRunner:
+    global runner
+    if runner is None:
+        runner = NativeRunner()
+    return runner
@@ -9,17 +9,20 @@ x86_parser = Lark(r"""
           | "subq" arg "," arg -> subq
           | "cmpq" arg "," arg -> cmpq
           | "xorq" arg "," arg -> xorq
+          | "andq" arg "," arg -> andq
+          | "sarq" arg "," arg -> sarq
           | "leaq" arg "," arg -> leaq
           | "negq" arg -> negq
           | "jmp" CNAME -> jmp
           | "jmp" "*" arg -> indirect_jmp
           | "je" CNAME -> je
-          | "jne" CNAME -> je
+          | "jne" CNAME -> jne
           | "jl" CNAME -> jl
           | "jle" CNAME -> jle
           | "jg" CNAME -> jg
           | "jge" CNAME -> jge
           | "sete" arg -> sete
+          | "setne" arg -> setne
           | "setl" arg -> setl
           | "setle" arg -> setle
           | "setg" arg -> setg
@@ -65,16 +68,20 @@ x86_parser_instrs = Lark(r"""
           | "subq" arg "," arg -> subq
           | "cmpq" arg "," arg -> cmpq
           | "xorq" arg "," arg -> xorq
+          | "andq" arg "," arg -> andq
+          | "sarq" arg "," arg -> sarq
           | "leaq" arg "," arg -> leaq
           | "negq" arg -> negq
           | "jmp" CNAME -> jmp
           | "jmp" "*" arg -> indirect_jmp
           | "je" CNAME -> je
+          | "jne" CNAME -> jne
           | "jl" CNAME -> jl
           | "jle" CNAME -> jle
           | "jg" CNAME -> jg
           | "jge" CNAME -> jge
           | "sete" arg -> sete
+          | "setne" arg -> setne
           | "setl" arg -> setl
           | "setle" arg -> setle
           | "setg" arg -> setg
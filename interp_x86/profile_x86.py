@@ -0,0 +1,85 @@
+# Execution profile for the x86 emulator: how often each block and each
+# instruction ran, how many loads and stores went to each memory region,
+# and how many times the garbage collector was called. The collector's
+# own loads and stores are counted apart from the program's. The report
+# is a plain dictionary keyed by block label, so it can be dumped as JSON.
+
+from collections import Counter
+
+from .decode_x86 import JMP, DecodedProgram
+from .memory_x86 import Memory
+from .trace_x86 import instr_text
+
+
+class Profile:
+    def __init__(self):
+        self.program = None
+        self.counts = None
+        self.loads = Counter()
+        self.stores = Counter()
+        self.collects = 0
+        # set while the collector runs, which sends memory traffic to
+        # gc_loads and gc_stores instead
+        self.collecting = False
+        self.gc_loads = Counter()
+        self.gc_stores = Counter()
+
+    def counts_for(self, program: DecodedProgram) -> list[list[int]]:
+        # one counter per instruction, indexed like program.code
+        if self.program is not program:
+            self.program = program
+            self.counts = [[0] * len(code) for code in program.code]
+        return self.counts
+
+    def report(self) -> dict:
+        program = self.program
+        blocks = {}
+        instructions = {}
+        total = 0
+        if program is not None:
+            for (b, counts) in enumerate(self.counts):
+                label = program.labels[b]
+                blocks[label] = counts[0] if counts else 0
+                instructions[label] = [
+                    {'offset': pc,
+                     'instr': instr_text(program.source[b][pc]),
+                     'count': n}
+                    for (pc, n) in enumerate(counts)]
+                total += sum(counts)
+                # a jump to the next block is left out of the assembly
+                # and falls through instead, so it does not count
+                code = program.code[b]
+                if code and code[-1][0] == JMP and code[-1][1] == b + 1:
+                    total -= counts[-1]
+        regions = ('stack', 'rootstack', 'heap')
+        return {
+            'instructions': total,
+            'blocks': blocks,
+            'block_instructions': instructions,
+            'loads': {r: self.loads[r] for r in regions},
+            'stores': {r: self.stores[r] for r in regions},
+            'collects': self.collects,
+            'gc': {'loads': {r: self.gc_loads[r] for r in regions},
+                   'stores': {r: self.gc_stores[r] for r in regions}},
+        }
+
+
+class ProfiledMemory(Memory):
+    # counts every load and store by the region it falls into, and by
+    # whether the program or the collector made it
+
+    def __init__(self, strict, profile: Profile):
+        super().__init__(strict)
+        self.profile = profile
+
+    def load(self, addr: int):
+        profile = self.profile
+        loads = profile.gc_loads if profile.collecting else profile.loads
+        loads[self.segment(addr).name] += 1
+        return super().load(addr)
+
+    def store(self, addr: int, v):
+        profile = self.profile
+        stores = profile.gc_stores if profile.collecting else profile.stores
+        stores[self.segment(addr).name] += 1
+        super().store(addr, v)
@@ -0,0 +1,184 @@
+# Tracing for the x86 emulator. A Tracer keeps a bounded ring buffer of
+# the most recent instructions executed, each with the location it
+# changed and the new value, and can take snapshots of the machine state
+# on entry to chosen blocks. Snapshots are plain dictionaries; pandas is
+# only imported when a DataFrame is asked for.
+
+from collections import deque
+from dataclasses import dataclass
+
+from lark import Tree
+
+from .decode_x86 import *
+
+
+def tree_text(t) -> str:
+    # AT&T syntax for an instruction or argument of the parse tree format
+    if not isinstance(t, Tree):
+        return str(t)
+    match t.data:
+        case 'reg_a':
+            return f'%{t.children[0]}'
+        case 'int_a' | 'neg_a':
+            return f'${decode_imm(t)}'
+        case 'mem_a':
+            offset, reg = t.children
+            return f'{decode_imm(offset)}(%{reg})'
+        case 'direct_mem_a':
+            return f'(%{t.children[0]})'
+        case 'global_val_a':
+            loc, reg = t.children
+            return f'{loc}(%{reg})'
+        case 'var_a':
+            return str(t.children[0])
+        case op:
+            return f'{op} ' + ', '.join(tree_text(a) for a in t.children)
+
+
+def instr_text(instr) -> str:
+    if isinstance(instr, Tree):
+        return tree_text(instr)
+    else:
+        return str(instr).strip()
+
+
+@dataclass(slots=True)
+class TraceRecord:
+    block: str
+    offset: int
+    instr: object
+    location: tuple | None
+    value: object
+
+    def instr_text(self) -> str:
+        return instr_text(self.instr)
+
+    def location_text(self) -> str | None:
+        if self.location is None:
+            return None
+        return f'{self.location[0]} {self.location[1]}'
+
+    def __str__(self):
+        result = f'{self.block}+{self.offset}: {self.instr_text()}'
+        if self.location is not None:
+            result += f'\t{self.location_text()} = {self.value}'
+        return result
+
+
+@dataclass
+class Snapshot:
+    registers: dict
+    memory: dict
+    variables: dict
+    global_vals: dict
+
+    def rows(self) -> list[tuple[str, object]]:
+        return [(f'mem {k}', v) for (k, v) in sorted(self.memory.items())] \
+            + [(f'reg {k}', v) for (k, v) in self.registers.items()] \
+            + [(f'var {k}', v) for (k, v) in self.variables.items()] \
+            + [(f'{k}', v) for (k, v) in self.global_vals.items()]
+
+    def __str__(self):
+        return '\n'.join(f'{l:<24} {v}' for (l, v) in self.rows())
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        pd.set_option("display.max_rows", None)
+        return pd.DataFrame(self.rows(), columns=['Location', 'Value'])
+
+
+# The operand an instruction writes. Pushes and calls write the word at
+# the new top of stack, which the tracer reads after the instruction ran.
+top_of_stack = (MEM, RSP, 0)
+
+def destination(op):
+    opc = op[0]
+    if opc in (MOVQ, MOVZBQ, ADDQ, SUBQ, XORQ, ANDQ, SARQ, LEAQ, SETCC):
+        return op[2]
+    elif opc in (NEGQ, POPQ):
+        return op[1]
+    elif opc in (PUSHQ, CALLQ, INDIRECT_CALLQ):
+        return top_of_stack
+    elif opc == CMPQ:
+        return (REG, EFLAGS)
+    elif opc == READ_INT:
+        return (REG, RAX)
+    elif opc == RETQ:
+        return (REG, RSP)
+    else:
+        return None
+
+
+class Tracer:
+    def __init__(self, size=1000, blocks=None, registers=None,
+                 snapshot_blocks=(), echo=False):
+        # the last `size` records are kept; `blocks` and `registers`
+        # restrict recording to instructions in those blocks and to
+        # instructions writing those registers
+        self.records = deque(maxlen=size)
+        self.blocks = set(blocks) if blocks is not None else None
+        self.registers = set(REGISTER_INDEX[r] for r in registers) \
+            if registers is not None else None
+        self.snapshot_blocks = set(snapshot_blocks)
+        self.snapshots = deque(maxlen=size)
+        self.echo = echo
+        self.count = 0
+
+    # called before the first instruction of a block runs, so a snapshot
+    # shows the state the block starts from
+    def enter_block(self, emu, program: DecodedProgram, block: int):
+        label = program.labels[block]
+        if label in self.snapshot_blocks:
+            self.snapshots.append((label, self.count, emu.snapshot()))
+
+    def record(self, emu, program: DecodedProgram, block: int, pc: int, op):
+        self.count += 1
+        label = program.labels[block]
+        if self.blocks is not None and label not in self.blocks:
+            return
+
+        dest = destination(op)
+        if self.registers is not None \
+           and (dest is None or dest[0] != REG or dest[1] not in self.registers):
+            return
+
+        if dest is None:
+            location = None
+            value = None
+        elif dest[0] == REG:
+            location = ('reg', REGISTERS[dest[1]])
+            value = emu.registers[dest[1]]
+        elif dest[0] == MEM:
+            addr = emu.registers[dest[1]] + dest[2]
+            location = ('mem', addr)
+            value = emu.memory.load(addr)
+        elif dest[0] == VAR:
+            location = ('var', dest[1])
+            value = emu.variables[dest[1]]
+        else:
+            location = ('global', dest[1])
+            value = emu.global_vals[dest[1]]
+
+        record = TraceRecord(label, pc, program.source[block][pc],
+                             location, value)
+        self.records.append(record)
+        if self.echo:
+            print(f'Evaluating instruction: {record}')
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __str__(self):
+        return '\n'.join(str(r) for r in self.records)
+
+    def to_dataframe(self):
+        import pandas as pd
+
+        return pd.DataFrame(
+            [(r.block, r.offset, r.instr_text(), r.location_text(), r.value)
+             for r in self.records],
+            columns=['Block', 'Offset', 'Instruction', 'Location', 'Value'])
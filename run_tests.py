@@ -1,4 +1,5 @@
-import compiler_tup as compiler
+import sys
+import compiler_tup
 import interp_Ltup
 import interp_Ctup
 import type_check_Ctup
@@ -6,7 +7,11 @@ import type_check_Ltup
 from utils import run_tests, enable_tracing
 from interp_x86.eval_x86 import interp_x86
 
-compiler = compiler.Compiler()
+# The source interpreters recurse once per loop iteration, and the
+# GC tests loop long enough to fill the heap.
+sys.setrecursionlimit(100000)
+
+compiler = compiler_tup.Compiler()
 
 ###########################################################################
 
@@ -15,34 +20,50 @@ type_check_Ctup = type_check_Ctup.TypeCheckCtup().type_check
 
 typecheck_dict = {
     'source': type_check_Ltup,
+    'fold_constants': type_check_Ltup,
     'remove_complex_operands': type_check_Ltup,
     'explicate_control': type_check_Ctup,
+    'number_values': type_check_Ctup,
+    'remove_dead_code': type_check_Ctup,
 }
 
 interp_Ltup = interp_Ltup.InterpLtup().interp
 interp_Ctup = interp_Ctup.InterpCtup().interp
 interp_dict = {
     'shrink': interp_Ltup,
+    'fold_constants': interp_Ltup,
     'remove_complex_operands': interp_Ltup,
     'expose_allocation': interp_Ltup,
     'explicate_control': interp_Ctup,
+    'number_values': interp_Ctup,
+    'remove_dead_code': interp_Ctup,
     'select_instructions': interp_x86,
+    'layout_blocks': interp_x86,
     'assign_homes': interp_x86,
     'patch_instructions': interp_x86,
+    'peephole': interp_x86,
     'prelude_and_conclusion': interp_x86,
 }
 
 # enable_tracing()
 
-run_tests('var', compiler, 'tup', typecheck_dict, interp_dict)
-run_tests('regalloc', compiler, 'tup', typecheck_dict, interp_dict)
-run_tests('lif', compiler, 'tup', typecheck_dict, interp_dict)
-run_tests('while', compiler, 'tup', typecheck_dict, interp_dict)
-
-run_tests('tup', compiler, 'tup', typecheck_dict, {
-   'shrink': interp_Ltup,
-   'expose_allocation': interp_Ltup,
-   'remove_complex_operands': interp_Ltup,
-   'explicate_control': interp_Ctup,
-   'prelude_and_conclusion': interp_x86,
-})
\ No newline at end of file
+tup_interp_dict = {
+    'shrink': interp_Ltup,
+    'fold_constants': interp_Ltup,
+    'expose_allocation': interp_Ltup,
+    'remove_complex_operands': interp_Ltup,
+    'explicate_control': interp_Ctup,
+    'number_values': interp_Ctup,
+    'remove_dead_code': interp_Ctup,
+    'prelude_and_conclusion': interp_x86,
+}
+
+# Run every suite under each register allocator.
+for (name, comp) in [('tup', compiler),
+                     ('tup_linear_scan',
+                      compiler_tup.Compiler(allocator='linear_scan'))]:
+    run_tests('var', comp, name, typecheck_dict, interp_dict)
+    run_tests('regalloc', comp, name, typecheck_dict, interp_dict)
+    run_tests('lif', comp, name, typecheck_dict, interp_dict)
+    run_tests('while', comp, name, typecheck_dict, interp_dict)
+    run_tests('tup', comp, name, typecheck_dict, tup_interp_dict)
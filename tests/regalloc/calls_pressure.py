@@ -0,0 +1,12 @@
+a = input_int()
+b = input_int()
+c = input_int()
+d = input_int()
+e = input_int()
+f = input_int()
+g = input_int()
+print(a + b)
+h = input_int()
+print(c + d + h)
+print(e - f)
+print(a + b + c + d + e + f + g + h)
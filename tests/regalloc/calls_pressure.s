@@ -0,0 +1,99 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $368, %rsp
+    movq %rbx, -336(%rbp)
+    movq %r12, -344(%rbp)
+    movq %r13, -352(%rbp)
+    movq %r14, -360(%rbp)
+    movq %r15, -368(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    callq read_int
+    movq %rax, %r12
+    callq read_int
+    movq %rax, %r13
+    callq read_int
+    movq %rax, %r14
+    callq read_int
+    movq %rax, -304(%rbp)
+    callq read_int
+    movq -304(%rbp), %rcx
+    movq %rax, %rdx
+    movq %rcx, -304(%rbp)
+    movq %rdx, -312(%rbp)
+    callq read_int
+    movq -304(%rbp), %rcx
+    movq -312(%rbp), %rdx
+    movq %rax, %rsi
+    addq %r12, %rbx
+    movq %rbx, %rdi
+    movq %rcx, -304(%rbp)
+    movq %rdx, -312(%rbp)
+    movq %rsi, -320(%rbp)
+    callq print_int
+    movq -304(%rbp), %rcx
+    movq -312(%rbp), %rdx
+    movq -320(%rbp), %rsi
+    movq %rcx, -304(%rbp)
+    movq %rdx, -312(%rbp)
+    movq %rsi, -320(%rbp)
+    callq read_int
+    movq -304(%rbp), %rcx
+    movq -312(%rbp), %rdx
+    movq -320(%rbp), %rsi
+    movq %rax, %r12
+    movq %r13, %r8
+    addq %r14, %r8
+    addq %r12, %r8
+    movq %r8, %rdi
+    movq %rcx, -304(%rbp)
+    movq %rdx, -312(%rbp)
+    movq %rsi, -320(%rbp)
+    callq print_int
+    movq -304(%rbp), %rcx
+    movq -312(%rbp), %rdx
+    movq -320(%rbp), %rsi
+    movq %rcx, %r8
+    subq %rdx, %r8
+    movq %r8, %rdi
+    movq %rcx, -304(%rbp)
+    movq %rdx, -312(%rbp)
+    movq %rsi, -320(%rbp)
+    callq print_int
+    movq -304(%rbp), %rcx
+    movq -312(%rbp), %rdx
+    movq -320(%rbp), %rsi
+    movq %rbx, %r8
+    addq %r13, %r8
+    addq %r14, %r8
+    addq %rcx, %r8
+    movq %r8, %rcx
+    addq %rdx, %rcx
+    addq %rsi, %rcx
+    addq %r12, %rcx
+    movq %rcx, %rdi
+    callq print_int
+    xorq %rax, %rax
+
+	.align 16
+conclusion:
+    movq -336(%rbp), %rbx
+    movq -344(%rbp), %r12
+    movq -352(%rbp), %r13
+    movq -360(%rbp), %r14
+    movq -368(%rbp), %r15
+    addq $368, %rsp
+    popq %rbp
+    retq 
+
+
@@ -0,0 +1,24 @@
+a = input_int()
+b = input_int()
+c = input_int()
+d = input_int()
+e = input_int()
+f = input_int()
+g = input_int()
+h = input_int()
+j = input_int()
+k = input_int()
+l = input_int()
+m = input_int()
+n = input_int()
+o = input_int()
+p = input_int()
+q = input_int()
+i = 0
+s = 0
+while i < 10:
+    s = s + a - b
+    i = i + 1
+print(s)
+print(c + d + e + f + g + h + j + k + l + m + n + o + p + q)
+print(a + b + s)
@@ -0,0 +1,240 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $640, %rsp
+    movq %rbx, -600(%rbp)
+    movq %r12, -608(%rbp)
+    movq %r13, -616(%rbp)
+    movq %r14, -624(%rbp)
+    movq %r15, -632(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    callq read_int
+    movq %rax, %r12
+    callq read_int
+    movq %rax, %r13
+    callq read_int
+    movq %rax, %r14
+    callq read_int
+    movq %rax, -544(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq %rax, %rdx
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq %rax, %rsi
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq %rax, %r8
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq %rax, %r9
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq %rax, %r10
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %r12, -464(%rbp)
+    movq %rax, %r12
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %rbx, -472(%rbp)
+    movq %rax, %rbx
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %rbx, -480(%rbp)
+    movq %rax, %rbx
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %rbx, -488(%rbp)
+    movq %rax, %rbx
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %rbx, -496(%rbp)
+    movq %rax, %rbx
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq read_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %rbx, -504(%rbp)
+    movq %rax, -512(%rbp)
+    xorq %rbx, %rbx
+    movq %r12, -520(%rbp)
+    xorq %r12, %r12
+    jmp loop_438
+
+	.align 16
+block_439:
+    movq %rcx, -528(%rbp)
+    movq %rdx, -536(%rbp)
+    movq -472(%rbp), %rcx
+    movq -464(%rbp), %rdx
+    addq %rcx, %r12
+    subq %rdx, %r12
+    addq $1, %rbx
+    movq %rcx, -472(%rbp)
+    movq %rdx, -464(%rbp)
+    movq -528(%rbp), %rcx
+    movq -536(%rbp), %rdx
+
+	.align 16
+loop_438:
+    cmpq $10, %rbx
+    jl block_439
+
+	.align 16
+block_437:
+    movq %r12, %rdi
+    movq %rcx, -544(%rbp)
+    movq %rdx, -552(%rbp)
+    movq %rsi, -560(%rbp)
+    movq %r8, -568(%rbp)
+    movq %r9, -576(%rbp)
+    movq %r10, -584(%rbp)
+    callq print_int
+    movq -544(%rbp), %rcx
+    movq -552(%rbp), %rdx
+    movq -560(%rbp), %rsi
+    movq -568(%rbp), %r8
+    movq -576(%rbp), %r9
+    movq -584(%rbp), %r10
+    movq %r13, %rbx
+    addq %r14, %rbx
+    addq %rcx, %rbx
+    movq %rbx, %rcx
+    addq %rdx, %rcx
+    addq %rsi, %rcx
+    addq %r8, %rcx
+    addq %r9, %rcx
+    addq %r10, %rcx
+    movq -520(%rbp), %rdx
+    addq %rdx, %rcx
+    movq -480(%rbp), %rdx
+    addq %rdx, %rcx
+    movq -488(%rbp), %rdx
+    addq %rdx, %rcx
+    movq -496(%rbp), %rdx
+    addq %rdx, %rcx
+    movq -504(%rbp), %rdx
+    addq %rdx, %rcx
+    movq -512(%rbp), %rdx
+    addq %rdx, %rcx
+    movq %rcx, %rdi
+    callq print_int
+    movq -472(%rbp), %rcx
+    movq -464(%rbp), %rdx
+    addq %rdx, %rcx
+    addq %r12, %rcx
+    movq %rcx, %rdi
+    callq print_int
+    xorq %rax, %rax
+
+	.align 16
+conclusion:
+    movq -600(%rbp), %rbx
+    movq -608(%rbp), %r12
+    movq -616(%rbp), %r13
+    movq -624(%rbp), %r14
+    movq -632(%rbp), %r15
+    addq $640, %rsp
+    popq %rbp
+    retq 
+
+
@@ -0,0 +1,11 @@
+keep = (input_int(), (2, 3))
+i = 0
+acc = 0
+while i < 400:
+    t = (i, (i, keep, i, i, i, i, i, i))
+    acc = acc + t[1][1][1][0]
+    i = i + 1
+print(acc)
+print(keep[0])
+print(keep[1][1])
+print(t[1][0])
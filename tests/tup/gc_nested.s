@@ -0,0 +1,206 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1104, %rsp
+    movq %rbx, -1064(%rbp)
+    movq %r12, -1072(%rbp)
+    movq %r13, -1080(%rbp)
+    movq %r14, -1088(%rbp)
+    movq %r15, -1096(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+    movq $0, 0(%r15)
+    movq $0, 8(%r15)
+    addq $16, %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    movq $2, %r12
+    movq $3, %r14
+    movq free_ptr(%rip), %rcx
+    addq $24, %rcx
+    cmpq fromspace_end(%rip), %rcx
+    jl block_199
+
+	.align 16
+block_200:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %r13, -8(%r15)
+    movq $0, -16(%r15)
+    callq collect
+    movq -8(%r15), %r13
+
+	.align 16
+block_199:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $5, 0(%r11)
+    movq %r11, %rcx
+    movq %rcx, %r11
+    movq %r12, 8(%r11)
+    movq %rcx, %r11
+    movq %r14, 16(%r11)
+    movq %rcx, %r12
+    movq free_ptr(%rip), %rcx
+    addq $24, %rcx
+    cmpq fromspace_end(%rip), %rcx
+    jl block_197
+
+	.align 16
+block_198:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %r13, -8(%r15)
+    movq %r12, -16(%r15)
+    callq collect
+    movq -8(%r15), %r13
+    movq -16(%r15), %r12
+
+	.align 16
+block_197:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $261, 0(%r11)
+    movq %r11, %rcx
+    movq %rcx, %r11
+    movq %rbx, 8(%r11)
+    movq %rcx, %r11
+    movq %r12, 16(%r11)
+    movq %rcx, %rbx
+    xorq %r14, %r14
+    movq $0, -1008(%rbp)
+    jmp loop_191
+
+	.align 16
+block_196:
+    movq %r14, %r13
+    movq %r14, %rcx
+    movq %r14, %rdx
+    movq %r14, %r8
+    movq %r14, %r9
+    movq %r14, %r10
+    movq %r14, %r12
+    movq free_ptr(%rip), %rsi
+    addq $72, %rsi
+    cmpq fromspace_end(%rip), %rsi
+    jl block_194
+
+	.align 16
+block_195:
+    movq %r15, %rdi
+    movq $72, %rsi
+    movq %rbx, -8(%r15)
+    movq %rbx, -16(%r15)
+    movq %rcx, -1016(%rbp)
+    movq %rdx, -1024(%rbp)
+    movq %r8, -1032(%rbp)
+    movq %r9, -1040(%rbp)
+    movq %r10, -1048(%rbp)
+    callq collect
+    movq -1016(%rbp), %rcx
+    movq -1024(%rbp), %rdx
+    movq -1032(%rbp), %r8
+    movq -1040(%rbp), %r9
+    movq -1048(%rbp), %r10
+    movq -8(%r15), %rbx
+    movq -16(%r15), %rbx
+
+	.align 16
+block_194:
+    movq free_ptr(%rip), %r11
+    addq $72, free_ptr(%rip)
+    movq $273, 0(%r11)
+    movq %r11, %rsi
+    movq %rsi, %r11
+    movq %r13, 8(%r11)
+    movq %rsi, %r11
+    movq %rbx, 16(%r11)
+    movq %rsi, %r11
+    movq %rcx, 24(%r11)
+    movq %rsi, %r11
+    movq %rdx, 32(%r11)
+    movq %rsi, %r11
+    movq %r8, 40(%r11)
+    movq %rsi, %r11
+    movq %r9, 48(%r11)
+    movq %rsi, %r11
+    movq %r10, 56(%r11)
+    movq %rsi, %r11
+    movq %r12, 64(%r11)
+    movq %rsi, %rcx
+    movq free_ptr(%rip), %rdx
+    addq $24, %rdx
+    cmpq fromspace_end(%rip), %rdx
+    jl block_192
+
+	.align 16
+block_193:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %rbx, -8(%r15)
+    movq %rcx, -16(%r15)
+    movq %rcx, -1016(%rbp)
+    callq collect
+    movq -1016(%rbp), %rcx
+    movq -8(%r15), %rbx
+    movq -16(%r15), %rcx
+
+	.align 16
+block_192:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $261, 0(%r11)
+    movq %r11, %r13
+    movq %r13, %r11
+    movq %r14, 8(%r11)
+    movq %r13, %r11
+    movq %rcx, 16(%r11)
+    movq %rcx, %r11
+    movq 16(%r11), %r11
+    movq 16(%r11), %r11
+    movq 8(%r11), %rcx
+    addq %rcx, -1008(%rbp)
+    addq $1, %r14
+
+	.align 16
+loop_191:
+    cmpq $400, %r14
+    jl block_196
+
+	.align 16
+block_190:
+    movq -1008(%rbp), %rdi
+    callq print_int
+    movq %rbx, %r11
+    movq 8(%r11), %rdi
+    callq print_int
+    movq %rbx, %r11
+    movq 16(%r11), %r11
+    movq 16(%r11), %rdi
+    callq print_int
+    movq %r13, %r11
+    movq 16(%r11), %r11
+    movq 8(%r11), %rdi
+    callq print_int
+    xorq %rax, %rax
+
+	.align 16
+conclusion:
+    subq $16, %r15
+    movq -1064(%rbp), %rbx
+    movq -1072(%rbp), %r12
+    movq -1080(%rbp), %r13
+    movq -1088(%rbp), %r14
+    movq -1096(%rbp), %r15
+    addq $1104, %rsp
+    popq %rbp
+    retq 
+
+
@@ -0,0 +1,16 @@
+a = (1, 2)
+b = (a, 3)
+n = input_int()
+i = 0
+s = 0
+while i < n:
+    c = (i, a, i, i, i, i, i, i)
+    d = (c, b, i, i, i, i, i, i)
+    s = s + d[0][0] + d[1][0][1]
+    if i == 150:
+        a = (7, 8)
+    i = i + 1
+print(s)
+print(a[0])
+print(b[0][0])
+print(d[0][1][1])
@@ -0,0 +1,318 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1280, %rsp
+    movq %rbx, -1248(%rbp)
+    movq %r12, -1256(%rbp)
+    movq %r13, -1264(%rbp)
+    movq %r14, -1272(%rbp)
+    movq %r15, -1280(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+    movq $0, 0(%r15)
+    movq $0, 8(%r15)
+    movq $0, 16(%r15)
+    movq $0, 24(%r15)
+    addq $32, %r15
+
+	.align 16
+start:
+    movq $1, %rbx
+    movq $2, %r12
+    movq free_ptr(%rip), %rdx
+    addq $24, %rdx
+    cmpq fromspace_end(%rip), %rdx
+    jl block_300
+
+	.align 16
+block_301:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %rcx, -8(%r15)
+    movq $0, -16(%r15)
+    movq $0, -24(%r15)
+    movq $0, -32(%r15)
+    movq %rcx, -1200(%rbp)
+    callq collect
+    movq -1200(%rbp), %rcx
+    movq -8(%r15), %rcx
+
+	.align 16
+block_300:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $5, 0(%r11)
+    movq %r11, %rdx
+    movq %rdx, %r11
+    movq %rbx, 8(%r11)
+    movq %rdx, %r11
+    movq %r12, 16(%r11)
+    movq %rdx, -1176(%rbp)
+    movq %rdx, %r12
+    movq $3, %rbx
+    movq free_ptr(%rip), %rdx
+    addq $24, %rdx
+    cmpq fromspace_end(%rip), %rdx
+    jl block_298
+
+	.align 16
+block_299:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %rcx, -8(%r15)
+    movq -1176(%rbp), %rax
+    movq %rax, -16(%r15)
+    movq %r12, -24(%r15)
+    movq $0, -32(%r15)
+    movq %rcx, -1200(%rbp)
+    callq collect
+    movq -1200(%rbp), %rcx
+    movq -8(%r15), %rcx
+    movq -16(%r15), %rax
+    movq %rax, -1176(%rbp)
+    movq -24(%r15), %r12
+
+	.align 16
+block_298:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $133, 0(%r11)
+    movq %r11, %rdx
+    movq %rdx, %r11
+    movq %r12, 8(%r11)
+    movq %rdx, %r11
+    movq %rbx, 16(%r11)
+    movq %rdx, -1184(%rbp)
+    movq %rcx, -1200(%rbp)
+    callq read_int
+    movq -1200(%rbp), %rcx
+    movq %rax, -1192(%rbp)
+    xorq %rdx, %rdx
+    xorq %r14, %r14
+
+	.align 16
+loop_288:
+    cmpq -1192(%rbp), %rdx
+    jge block_287
+
+	.align 16
+block_297:
+    movq %rdx, %r13
+    movq -1176(%rbp), %r12
+    movq %rdx, %rcx
+    movq %rdx, %r8
+    movq %rdx, %r9
+    movq %rdx, %r10
+    movq %rdx, %rbx
+    movq free_ptr(%rip), %rsi
+    addq $72, %rsi
+    cmpq fromspace_end(%rip), %rsi
+    jl block_295
+
+	.align 16
+block_296:
+    movq %r15, %rdi
+    movq $72, %rsi
+    movq %r12, -8(%r15)
+    movq -1176(%rbp), %rax
+    movq %rax, -16(%r15)
+    movq -1184(%rbp), %rax
+    movq %rax, -24(%r15)
+    movq $0, -32(%r15)
+    movq %rcx, -1200(%rbp)
+    movq %rdx, -1208(%rbp)
+    movq %r8, -1216(%rbp)
+    movq %r9, -1224(%rbp)
+    movq %r10, -1232(%rbp)
+    callq collect
+    movq -1200(%rbp), %rcx
+    movq -1208(%rbp), %rdx
+    movq -1216(%rbp), %r8
+    movq -1224(%rbp), %r9
+    movq -1232(%rbp), %r10
+    movq -8(%r15), %r12
+    movq -16(%r15), %rax
+    movq %rax, -1176(%rbp)
+    movq -24(%r15), %rax
+    movq %rax, -1184(%rbp)
+
+	.align 16
+block_295:
+    movq free_ptr(%rip), %r11
+    addq $72, free_ptr(%rip)
+    movq $273, 0(%r11)
+    movq %r11, %rsi
+    movq %rsi, %r11
+    movq %r13, 8(%r11)
+    movq %rsi, %r11
+    movq %r12, 16(%r11)
+    movq %rsi, %r11
+    movq %rdx, 24(%r11)
+    movq %rsi, %r11
+    movq %rcx, 32(%r11)
+    movq %rsi, %r11
+    movq %r8, 40(%r11)
+    movq %rsi, %r11
+    movq %r9, 48(%r11)
+    movq %rsi, %r11
+    movq %r10, 56(%r11)
+    movq %rsi, %r11
+    movq %rbx, 64(%r11)
+    movq %rsi, %r8
+    movq -1184(%rbp), %rbx
+    movq %rdx, %rcx
+    movq %rdx, %r9
+    movq %rdx, %r10
+    movq %rdx, %r12
+    movq %rdx, %r13
+    movq free_ptr(%rip), %rsi
+    addq $72, %rsi
+    cmpq fromspace_end(%rip), %rsi
+    jl block_293
+
+	.align 16
+block_294:
+    movq %r15, %rdi
+    movq $72, %rsi
+    movq %r8, -8(%r15)
+    movq -1176(%rbp), %rax
+    movq %rax, -16(%r15)
+    movq -1184(%rbp), %rax
+    movq %rax, -24(%r15)
+    movq %rbx, -32(%r15)
+    movq %rcx, -1200(%rbp)
+    movq %rdx, -1208(%rbp)
+    movq %r8, -1216(%rbp)
+    movq %r9, -1224(%rbp)
+    movq %r10, -1232(%rbp)
+    callq collect
+    movq -1200(%rbp), %rcx
+    movq -1208(%rbp), %rdx
+    movq -1216(%rbp), %r8
+    movq -1224(%rbp), %r9
+    movq -1232(%rbp), %r10
+    movq -8(%r15), %r8
+    movq -16(%r15), %rax
+    movq %rax, -1176(%rbp)
+    movq -24(%r15), %rax
+    movq %rax, -1184(%rbp)
+    movq -32(%r15), %rbx
+
+	.align 16
+block_293:
+    movq free_ptr(%rip), %r11
+    addq $72, free_ptr(%rip)
+    movq $401, 0(%r11)
+    movq %r11, %rsi
+    movq %rsi, %r11
+    movq %r8, 8(%r11)
+    movq %rsi, %r11
+    movq %rbx, 16(%r11)
+    movq %rsi, %r11
+    movq %rdx, 24(%r11)
+    movq %rsi, %r11
+    movq %rcx, 32(%r11)
+    movq %rsi, %r11
+    movq %r9, 40(%r11)
+    movq %rsi, %r11
+    movq %r10, 48(%r11)
+    movq %rsi, %r11
+    movq %r12, 56(%r11)
+    movq %rsi, %r11
+    movq %r13, 64(%r11)
+    movq %rsi, %rcx
+    movq %r8, %r11
+    movq 8(%r11), %rsi
+    addq %rsi, %r14
+    movq %rbx, %r11
+    movq 8(%r11), %r11
+    movq 16(%r11), %rsi
+    addq %rsi, %r14
+    cmpq $150, %rdx
+    je block_292
+
+	.align 16
+block_289:
+    addq $1, %rdx
+    jmp loop_288
+
+	.align 16
+block_292:
+    movq $7, %r12
+    movq $8, %r13
+    movq free_ptr(%rip), %rsi
+    addq $24, %rsi
+    cmpq fromspace_end(%rip), %rsi
+    jl block_290
+
+	.align 16
+block_291:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %rcx, -8(%r15)
+    movq $0, -16(%r15)
+    movq -1184(%rbp), %rax
+    movq %rax, -24(%r15)
+    movq $0, -32(%r15)
+    movq %rcx, -1200(%rbp)
+    movq %rdx, -1208(%rbp)
+    callq collect
+    movq -1200(%rbp), %rcx
+    movq -1208(%rbp), %rdx
+    movq -8(%r15), %rcx
+    movq -24(%r15), %rax
+    movq %rax, -1184(%rbp)
+
+	.align 16
+block_290:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $5, 0(%r11)
+    movq %r11, %rsi
+    movq %rsi, %r11
+    movq %r12, 8(%r11)
+    movq %rsi, %r11
+    movq %r13, 16(%r11)
+    movq %rsi, -1176(%rbp)
+    jmp block_289
+
+	.align 16
+block_287:
+    movq %r14, %rdi
+    movq %rcx, -1200(%rbp)
+    callq print_int
+    movq -1200(%rbp), %rcx
+    movq -1176(%rbp), %r11
+    movq 8(%r11), %rdi
+    movq %rcx, -1200(%rbp)
+    callq print_int
+    movq -1200(%rbp), %rcx
+    movq -1184(%rbp), %r11
+    movq 8(%r11), %r11
+    movq 8(%r11), %rdi
+    movq %rcx, -1200(%rbp)
+    callq print_int
+    movq -1200(%rbp), %r11
+    movq 8(%r11), %r11
+    movq 16(%r11), %r11
+    movq 16(%r11), %rdi
+    callq print_int
+    xorq %rax, %rax
+
+	.align 16
+conclusion:
+    subq $32, %r15
+    movq -1248(%rbp), %rbx
+    movq -1256(%rbp), %r12
+    movq -1264(%rbp), %r13
+    movq -1272(%rbp), %r14
+    movq -1280(%rbp), %r15
+    addq $1280, %rsp
+    popq %rbp
+    retq 
+
+
@@ -0,0 +1,8 @@
+t1 = (input_int(), 7)
+t2 = t1
+t3 = (input_int(), 7)
+same = t1 == t3
+ident = t1 is t3
+print(1 if ident else 0)
+print(1 if t1 == t2 else 0)
+print(1 if t1 is t2 else 0)
@@ -0,0 +1,141 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1072, %rsp
+    movq %rbx, -1048(%rbp)
+    movq %r12, -1056(%rbp)
+    movq %r13, -1064(%rbp)
+    movq %r15, -1072(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+    movq $0, 0(%r15)
+    movq $0, 8(%r15)
+    addq $16, %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    movq $7, %r12
+    movq free_ptr(%rip), %rcx
+    addq $24, %rcx
+    cmpq fromspace_end(%rip), %rcx
+    jl block_199
+
+	.align 16
+block_200:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq $0, -8(%r15)
+    movq $0, -16(%r15)
+    callq collect
+
+	.align 16
+block_199:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $5, 0(%r11)
+    movq %r11, %rcx
+    movq %rcx, %r11
+    movq %rbx, 8(%r11)
+    movq %rcx, %r11
+    movq %r12, 16(%r11)
+    movq %rcx, %rbx
+    callq read_int
+    movq %rax, %r12
+    movq $7, %r13
+    movq free_ptr(%rip), %rcx
+    addq $24, %rcx
+    cmpq fromspace_end(%rip), %rcx
+    jl block_197
+
+	.align 16
+block_198:
+    movq %r15, %rdi
+    movq $24, %rsi
+    movq %rbx, -8(%r15)
+    movq %rbx, -16(%r15)
+    callq collect
+    movq -8(%r15), %rbx
+    movq -16(%r15), %rbx
+
+	.align 16
+block_197:
+    movq free_ptr(%rip), %r11
+    addq $24, free_ptr(%rip)
+    movq $5, 0(%r11)
+    movq %r11, %rcx
+    movq %rcx, %r11
+    movq %r12, 8(%r11)
+    movq %rcx, %r11
+    movq %r13, 16(%r11)
+    cmpq %rcx, %rbx
+    sete %al
+    movzbq %al, %rcx
+    cmpq $0, %rcx
+    je block_195
+
+	.align 16
+block_196:
+    movq $1, %rcx
+
+	.align 16
+block_194:
+    movq %rcx, %rdi
+    callq print_int
+    cmpq %rbx, %rbx
+    je block_192
+
+	.align 16
+block_193:
+    xorq %rcx, %rcx
+
+	.align 16
+block_191:
+    movq %rcx, %rdi
+    callq print_int
+    cmpq %rbx, %rbx
+    je block_189
+
+	.align 16
+block_190:
+    xorq %rcx, %rcx
+
+	.align 16
+block_188:
+    movq %rcx, %rdi
+    callq print_int
+    xorq %rax, %rax
+    jmp conclusion
+
+	.align 16
+block_189:
+    movq $1, %rcx
+    jmp block_188
+
+	.align 16
+block_192:
+    movq $1, %rcx
+    jmp block_191
+
+	.align 16
+block_195:
+    xorq %rcx, %rcx
+    jmp block_194
+
+	.align 16
+conclusion:
+    subq $16, %r15
+    movq -1048(%rbp), %rbx
+    movq -1056(%rbp), %r12
+    movq -1064(%rbp), %r13
+    movq -1072(%rbp), %r15
+    addq $1072, %rsp
+    popq %rbp
+    retq 
+
+
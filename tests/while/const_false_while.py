@@ -0,0 +1,8 @@
+x = input_int()
+while 1 > 2:
+    x = x + 100
+    print(x)
+y = 2 + 3
+while y < 3 + 1:
+    y = y - 1
+print(x + y)
@@ -0,0 +1,43 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1296, %rsp
+    movq %r15, -1296(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rcx
+    movq $5, %rdx
+    jmp loop_555
+
+	.align 16
+block_556:
+    subq $1, %rdx
+
+	.align 16
+loop_555:
+    cmpq $4, %rdx
+    jl block_556
+
+	.align 16
+block_554:
+    addq %rdx, %rcx
+    movq %rcx, %rdi
+    callq print_int
+    xorq %rax, %rax
+
+	.align 16
+conclusion:
+    movq -1296(%rbp), %r15
+    addq $1296, %rsp
+    popq %rbp
+    retq 
+
+
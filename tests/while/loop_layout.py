@@ -0,0 +1,15 @@
+n = input_int()
+i = 0
+s = 0
+while i < n:
+    j = 0
+    while j < i:
+        if j < 2:
+            s = s + 1
+        else:
+            s = s + j
+        j = j + 1
+    if s > 20:
+        print(s)
+    i = i + 1
+print(s)
@@ -0,0 +1,88 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1184, %rsp
+    movq %rbx, -1152(%rbp)
+    movq %r12, -1160(%rbp)
+    movq %r13, -1168(%rbp)
+    movq %r15, -1176(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    xorq %r12, %r12
+    xorq %r13, %r13
+
+	.align 16
+loop_523:
+    cmpq %rbx, %r12
+    jge block_522
+
+	.align 16
+block_532:
+    xorq %rcx, %rcx
+
+	.align 16
+loop_527:
+    cmpq %r12, %rcx
+    jge block_526
+
+	.align 16
+block_531:
+    cmpq $2, %rcx
+    jl block_529
+
+	.align 16
+block_530:
+    addq %rcx, %r13
+
+	.align 16
+block_528:
+    addq $1, %rcx
+    jmp loop_527
+
+	.align 16
+block_529:
+    addq $1, %r13
+    jmp block_528
+
+	.align 16
+block_526:
+    cmpq $20, %r13
+    jg block_525
+
+	.align 16
+block_524:
+    addq $1, %r12
+    jmp loop_523
+
+	.align 16
+block_525:
+    movq %r13, %rdi
+    callq print_int
+    jmp block_524
+
+	.align 16
+block_522:
+    movq %r13, %rdi
+    callq print_int
+    xorq %rax, %rax
+
+	.align 16
+conclusion:
+    movq -1152(%rbp), %rbx
+    movq -1160(%rbp), %r12
+    movq -1168(%rbp), %r13
+    movq -1176(%rbp), %r15
+    addq $1184, %rsp
+    popq %rbp
+    retq 
+
+
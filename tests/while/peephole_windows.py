@@ -0,0 +1,12 @@
+x = input_int()
+y = input_int()
+z = 0
+i = 0
+while i < 3:
+    z = z + (- y)
+    x = x + (- i)
+    i = i + 1
+t = z + 0
+print(t)
+print(x + (- z))
+print(1 if z < x else 0)
@@ -0,0 +1,75 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1120, %rsp
+    movq %rbx, -1104(%rbp)
+    movq %r12, -1112(%rbp)
+    movq %r15, -1120(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    callq read_int
+    movq %rax, %rcx
+    xorq %r12, %r12
+    xorq %rdx, %rdx
+    jmp loop_517
+
+	.align 16
+block_518:
+    movq %rcx, %rsi
+    subq %rsi, %r12
+    movq %rdx, %rsi
+    subq %rsi, %rbx
+    addq $1, %rdx
+
+	.align 16
+loop_517:
+    cmpq $3, %rdx
+    jl block_518
+
+	.align 16
+block_516:
+    movq %r12, %rdi
+    callq print_int
+    movq %r12, %rcx
+    movq %rbx, %rdx
+    subq %rcx, %rdx
+    movq %rdx, %rdi
+    callq print_int
+    cmpq %rbx, %r12
+    jl block_514
+
+	.align 16
+block_515:
+    xorq %rcx, %rcx
+
+	.align 16
+block_513:
+    movq %rcx, %rdi
+    callq print_int
+    xorq %rax, %rax
+    jmp conclusion
+
+	.align 16
+block_514:
+    movq $1, %rcx
+    jmp block_513
+
+	.align 16
+conclusion:
+    movq -1104(%rbp), %rbx
+    movq -1112(%rbp), %r12
+    movq -1120(%rbp), %r15
+    addq $1120, %rsp
+    popq %rbp
+    retq 
+
+
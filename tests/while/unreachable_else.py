@@ -0,0 +1,14 @@
+x = input_int()
+if 3 < 4:
+    print(x)
+else:
+    print(0 - x)
+    x = input_int()
+z = 10 - 4
+if z == 6 and x > 0:
+    print(x + z)
+else:
+    print(z)
+if not (z == 6):
+    print(1)
+print(x)
@@ -0,0 +1,51 @@
+	.globl main
+	.align 16
+main:
+    pushq %rbp
+    movq %rsp, %rbp
+    subq $1088, %rsp
+    movq %rbx, -1080(%rbp)
+    movq %r15, -1088(%rbp)
+    movq $16384, %rdi
+    movq $16384, %rsi
+    callq initialize
+    movq rootstack_begin(%rip), %r15
+
+	.align 16
+start:
+    callq read_int
+    movq %rax, %rbx
+    movq %rbx, %rdi
+    callq print_int
+    cmpq $0, %rbx
+    jg block_506
+
+	.align 16
+block_507:
+    movq $6, %rdi
+    callq print_int
+
+	.align 16
+block_505:
+    movq %rbx, %rdi
+    callq print_int
+    xorq %rax, %rax
+    jmp conclusion
+
+	.align 16
+block_506:
+    movq %rbx, %rcx
+    addq $6, %rcx
+    movq %rcx, %rdi
+    callq print_int
+    jmp block_505
+
+	.align 16
+conclusion:
+    movq -1080(%rbp), %rbx
+    movq -1088(%rbp), %r15
+    addq $1088, %rsp
+    popq %rbp
+    retq 
+
+
@@ -1179,9 +1179,29 @@ def test_pass(passname, interp_dict, program_root, ast,
         return 0  # ??
 
 
+# Run the final x86 programs in the emulator, or assemble, link and run
+# them natively with interp_x86.native_x86.
+emulate_x86 = True
+
+
+# Compares a program's output with the golden file, returns 1 on success.
+def check_output(program_root, compiler_name):
+    result = os.system('diff' + ' -b ' + program_root + '.out ' \
+                       + program_root + '.golden')
+    if result == 0:
+        return 1
+    else:
+        print('compiler ' + compiler_name + ', executable failed' \
+              + ' on test ' + program_root)
+        return 0
+
+
+# With `pending` given, a native run is only started: the job is added
+# to `pending`, together with whether an earlier pass failed, and the
+# test result is None until run_tests checks it.
 def compile_and_test(compiler, compiler_name,
                      type_check_dict, interp_dict,
-                     program_filename):
+                     program_filename, pending=None):
     total_passes = 0
     successful_passes = 0
     from interp_x86.eval_x86 import interp_x86
@@ -1344,6 +1364,19 @@ def compile_and_test(compiler, compiler_name,
             test_pass(passname, interp_dict, program_root, program,
                       compiler_name)
 
+    passname = 'fold_constants'
+    if hasattr(compiler, passname):
+        trace('\n# ' + passname + '\n')
+        program = compiler.fold_constants(program)
+        trace(program)
+        if passname in type_check_dict.keys():
+            trace('type checking after ' + passname + '\n')
+            type_check_dict[passname](program)
+        total_passes += 1
+        successful_passes += \
+            test_pass(passname, interp_dict, program_root, program,
+                      compiler_name)
+
     passname = 'expose_allocation'
     if hasattr(compiler, passname):
         trace('\n# ' + passname + '\n')
@@ -1383,6 +1416,30 @@ def compile_and_test(compiler, compiler_name,
             test_pass(passname, interp_dict, program_root, program,
                       compiler_name)
 
+    passname = 'number_values'
+    if hasattr(compiler, passname):
+        trace('\n# ' + passname + '\n')
+        program = compiler.number_values(program)
+        trace(program)
+        if passname in type_check_dict.keys():
+            type_check_dict[passname](program)
+        total_passes += 1
+        successful_passes += \
+            test_pass(passname, interp_dict, program_root, program,
+                      compiler_name)
+
+    passname = 'remove_dead_code'
+    if hasattr(compiler, passname):
+        trace('\n# ' + passname + '\n')
+        program = compiler.remove_dead_code(program)
+        trace(program)
+        if passname in type_check_dict.keys():
+            type_check_dict[passname](program)
+        total_passes += 1
+        successful_passes += \
+            test_pass(passname, interp_dict, program_root, program,
+                      compiler_name)
+
     passname = 'select_instructions'
     trace('\n# ' + passname + '\n')
     program = compiler.select_instructions(program)
@@ -1392,6 +1449,16 @@ def compile_and_test(compiler, compiler_name,
         test_pass(passname, interp_dict, program_root, program,
                   compiler_name)
 
+    passname = 'layout_blocks'
+    if hasattr(compiler, passname):
+        trace('\n# ' + passname + '\n')
+        program = compiler.layout_blocks(program)
+        trace(program)
+        total_passes += 1
+        successful_passes += \
+            test_pass(passname, interp_dict, program_root, program,
+                      compiler_name)
+
     passname = 'assign_homes'
     trace('\n# ' + passname + '\n')
     program = compiler.assign_homes(program)
@@ -1410,6 +1477,16 @@ def compile_and_test(compiler, compiler_name,
         test_pass(passname, interp_dict, program_root, program,
                   compiler_name)
 
+    passname = 'peephole'
+    if hasattr(compiler, passname):
+        trace('\n# ' + passname + '\n')
+        program = compiler.peephole(program)
+        trace(program)
+        total_passes += 1
+        successful_passes += \
+            test_pass(passname, interp_dict, program_root, program,
+                      compiler_name)
+
     trace('\n# prelude and conclusion\n')
     program = compiler.prelude_and_conclusion(program)
     trace(program)
@@ -1422,33 +1499,43 @@ def compile_and_test(compiler, compiler_name,
     total_passes += 1
 
     # Run the final x86 program
-    emulate_x86 = True
     if emulate_x86:
         stdin = sys.stdin
         stdout = sys.stdout
         sys.stdin = open(program_root + '.in', 'r')
         sys.stdout = open(program_root + '.out', 'w')
-        interp_x86(program)
+        # emulate the assembly as written, which relies on blocks
+        # falling through into the next one
+        interp_x86(str(program))
         sys.stdin = stdin
         sys.stdout = stdout
     else:
-        if platform == 'darwin':
-            os.system('gcc -arch x86_64 runtime.o ' + x86_filename)
-        else:
-            os.system('gcc runtime.o ' + x86_filename)
-        input_file = program_root + '.in'
-        output_file = program_root + '.out'
-        os.system('./a.out < ' + input_file + ' > ' + output_file)
+        job = run_native(str(program), program_root)
+        if pending is not None:
+            pending.append((job, program_root,
+                            successful_passes < total_passes - 1))
+            return (successful_passes, total_passes, None)
+        job.result()
 
-    result = os.system('diff' + ' -b ' + program_root + '.out ' \
-                       + program_root + '.golden')
-    if result == 0:
-        successful_passes += 1
-        return (successful_passes, total_passes, 1)
-    else:
-        print('compiler ' + compiler_name + ', executable failed' \
-              + ' on test ' + program_root)
-        return (successful_passes, total_passes, 0)
+    success = check_output(program_root, compiler_name)
+    return (successful_passes + success, total_passes, success)
+
+
+# Starts running an x86 program natively on the .in file of a test,
+# writing its output to the .out file once it finishes.
+def run_native(asm, program_root):
+    from interp_x86.native_x86 import native_runner
+
+    with open(program_root + '.in') as f:
+        stdin = f.read()
+
+    def write_output(result):
+        with open(program_root + '.out', 'w') as f:
+            f.write(result.stdout)
+        return result
+
+    return native_runner().pool.submit(
+        lambda: write_output(native_runner().run(asm, stdin)))
 
 
 def trace_ast_and_concrete(ast):
@@ -1551,11 +1638,11 @@ def compile(compiler, compiler_name, type_check_L, type_check_C,
 # checking that the resulting programs produce output that matches the
 # golden file.
 def run_one_test(test, lang, compiler, compiler_name,
-                 type_check_dict, interp_dict):
+                 type_check_dict, interp_dict, pending=None):
 #    test_root = os.path.splitext(test)[0]
 #    test_name = os.path.basename(test_root)
     return compile_and_test(compiler, compiler_name, type_check_dict,
-                            interp_dict, test)
+                            interp_dict, test, pending)
 
 
 # Given the name of a language, a compiler, the compiler's name, a
@@ -1579,17 +1666,30 @@ def run_tests(lang, compiler, compiler_name, type_check_dict, interp_dict):
     total_passes = 0
     successful_tests = 0
     total_tests = 0
+    # native runs of all the tests go on concurrently and are checked
+    # once every test has been compiled
+    pending = None if emulate_x86 else []
     for test in tests:
         (succ_passes, tot_passes, succ_test) = \
             run_one_test(test, lang, compiler, compiler_name,
-                         type_check_dict, interp_dict)
+                         type_check_dict, interp_dict, pending)
         successful_passes += succ_passes
         total_passes += tot_passes
+        total_tests += 1
+        if succ_test is None:
+            continue
         successful_tests += succ_test
         
         if succ_passes < tot_passes:
            print(' * ' + os.path.splitext(os.path.basename(test))[0])
-        total_tests += 1
+
+    for (job, program_root, failed_passes) in pending or []:
+        job.result()
+        success = check_output(program_root, compiler_name)
+        successful_passes += success
+        successful_tests += success
+        if failed_passes or not success:
+           print(' * ' + os.path.basename(program_root))
 
     # Report the pass/fails
     print('tests: ' + repr(successful_tests) + '/' + repr(total_tests) \
@@ -14,11 +14,16 @@ class X86Program:
     def __str__(self):
         result = ''
         if isinstance(self.body, dict):
-            for (l,ss) in self.body.items():
+            labels = list(self.body.keys())
+            for (k, (l,ss)) in enumerate(self.body.items()):
                 if l == label_name('main'):
                     result += '\t.globl ' + label_name('main') + '\n'
                 result += '\t.align 16\n'
                 result += l + ':\n'
+                # a jump to the next block falls through instead
+                match ss[-1:]:
+                    case [Jump(target)] if labels[k+1:k+2] == [target]:
+                        ss = ss[:-1]
                 indent()
                 result += ''.join([str(s) for s in ss]) + '\n'
                 dedent()